@@ -3,6 +3,8 @@
 import streamlit as st
 import os
 import sys
+import requests
+from requests.adapters import HTTPAdapter
 
 # Adjusting sys.path so that src/ is recognized
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -10,15 +12,61 @@ project_root = os.path.abspath(os.path.join(current_dir, ".."))
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
-from src.pubmed_api import get_summaries, filter_medline_summaries
-from src.rag_pipeline import build_index, find_top_k
-from src.summarizer import generate_answer
 from src.utils import parse_date
-from src.keyword_extraction import extract_keywords
-from src.enhanced_search import build_refined_query_with_mesh, do_two_phase_search, get_synonyms_dict_gpt
+from src.pubmed_api import set_metadata_store, set_session
+from src.metadata_store import ArticleMetadataStore, open_metadata_store
+from src.mesh_index import MeshIndex, load_mesh_index
+from src.pipeline import (
+    PipelineResult, build_followup_pipeline, build_search_pipeline, followup_state, new_state
+)
+
+@st.cache_resource
+def get_http_session() -> requests.Session:
+    """
+    Process-wide HTTP session so E-utilities calls reuse pooled connections across reruns and users.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+@st.cache_resource
+def get_mesh_index(path: str) -> MeshIndex:
+    """
+    Process-wide MeSH index handle; the mmap is shared by all sessions.
+    """
+    return load_mesh_index(path)
+
+@st.cache_resource
+def get_article_store(path: str) -> ArticleMetadataStore:
+    """
+    Process-wide article metadata store, loaded from METADATA_STORE_PATH when it exists.
+    """
+    return open_metadata_store(path)
+
+def render_result(result: PipelineResult) -> None:
+    if result.halted:
+        st.warning(f"⚠️ {result.halted}")
+    else:
+        st.subheader("Summaries")
+        st.write(result.state["answer"])
+
+        # Step 10: Display References
+        st.subheader("References")
+        for item in result.state["top_chunks"]:
+            pmid_link = f"https://pubmed.ncbi.nlm.nih.gov/{item['pmid']}/"
+            st.markdown(f"- PMID [{item['pmid']}]({pmid_link})")
+
+    with st.expander(f"Pipeline Trace ({result.total_time:.2f} s)"):
+        st.table(result.trace_dicts())
 
 def main():
     st.title("PubMed Article Summarizer")
+    set_session(get_http_session())
+    store_path = os.getenv("METADATA_STORE_PATH", "")
+    store = get_article_store(store_path)
+    set_metadata_store(store)
 
     # Sidebar
     st.sidebar.header("🔍 Search Settings")
@@ -90,75 +138,88 @@ def main():
         help="Type your research question or topic."
     )
 
+    search_key = (
+        user_query, start_str, end_str, retmax, most_relevant, filter_med, use_keyword_extraction, use_synonyms
+    )
+    trace_path = os.getenv("PIPELINE_TRACE_PATH")
+
     if st.button("🔍 Search & Summarize"):
         if not user_query.strip():
             st.warning("⚠️ Please enter a query before searching.")
             return
 
-        # Step 1: GPT-based Keyword Extraction
-        if use_keyword_extraction:
-            extracted = extract_keywords(user_query, model_name="gpt-4")
-            st.write("**Extracted Keywords:**", extracted)
+        cached = st.session_state.get("search")
+        if cached and cached["key"] == search_key and not cached["result"].halted:
+            # Same search and settings: reuse the PMIDs, summaries and index from the session
+            result = build_followup_pipeline().run(followup_state(cached["result"].state, user_query), trace_path=trace_path)
         else:
-            extracted = user_query  # Fallback to user query if extraction is disabled
-
-        # Step 2: Synonyms Expansions via GPT
-        synonyms_dict = {}
-        if use_synonyms:
-            synonyms_dict = get_synonyms_dict_gpt(extracted, model_name="gpt-4")
-
-        # Step 3: Build a Refined PubMed Query
-        main_terms = [t.strip() for t in extracted.split(",") if t.strip()]
-        query_str = build_refined_query_with_mesh(main_terms, synonyms_dict)
+            state = new_state(
+                user_query,
+                start_date=parse_date(start_str) or "",
+                end_date=parse_date(end_str) or "",
+                retmax=retmax,
+                most_relevant=most_relevant,
+                filter_medline=filter_med,
+                use_keyword_extraction=use_keyword_extraction,
+                use_synonyms=use_synonyms,
+            )
+            # Steps 1-9 run as pipeline stages; a local MeSH index is used if one is configured
+            mesh_index_path = os.getenv("MESH_INDEX_PATH", "")
+            if mesh_index_path and os.path.exists(mesh_index_path):
+                state["mesh_index"] = get_mesh_index(mesh_index_path)
+            result = build_search_pipeline().run(state, trace_path=trace_path)
+            if store_path:
+                store.save(store_path)
+
+        st.session_state["search"] = {"key": search_key, "result": result}
+        st.session_state.pop("followup", None)
+
+    # Results live in the session, so they survive reruns triggered by other widgets
+    search = st.session_state.get("search")
+    if not search:
+        return
+
+    state = search["result"].state
+    if state.get("use_keyword_extraction") and "extracted" in state:
+        st.write("**Extracted Keywords:**", state["extracted"])
+    if "query_str" in state:
         with st.expander("View Final PubMed Query"):
-            st.write(query_str)
-
-        # Step 4: Perform Two-Phase Search (Exact + Related Articles)
-        pmids = do_two_phase_search(
-            query_str, 
-            parse_date(start_str) or "",
-            parse_date(end_str) or "",
-            retmax,
-            most_relevant
+            st.write(state["query_str"])
+    render_result(search["result"])
+
+    if search["result"].halted:
+        return
+
+    # Narrowing already-fetched results runs on the local metadata store, without network calls
+    with st.expander("Refine Results"):
+        refine_start = st.date_input("Published from", value=None, key="refine_start")
+        refine_end = st.date_input("Published until", value=None, key="refine_end")
+        summaries = state.get("summaries", [])
+        journals = st.multiselect("Journals", sorted({s["journal"] for s in summaries}), key="refine_journals")
+        refined = store.filter(
+            [s["pmid"] for s in summaries],
+            start_date=refine_start.strftime("%Y-%m-%d") if refine_start else "",
+            end_date=refine_end.strftime("%Y-%m-%d") if refine_end else "",
+            journals=journals or None,
         )
-        if not pmids:
-            st.warning("⚠️ No articles found after applying expansions and related searches.")
-            return
-
-        # Step 5: Retrieve Summaries
-        summaries = get_summaries(pmids)
-        if filter_med:
-            summaries = filter_medline_summaries(summaries)
-
-        if not summaries:
-            st.warning("⚠️ No articles found after applying MEDLINE filtering.")
-            return
-
-        # Step 6: Prepare Articles for RAG Pipeline
-        articles_for_rag = []
-        for s in summaries:
-            pmid = s["pmid"]
-            # Here, using title and pubdate as a placeholder.
-            fake_abstract = f"{s['title']} - {s['pubdate']}"
-            articles_for_rag.append({"pmid": pmid, "abstract": fake_abstract})
-
-        # Step 7: Build RAG Index
-        rag_index = build_index(articles_for_rag, chunk_size=300)
-
-        # Step 8: Find Top Chunks Relevant to User Query
-        top_chunks = find_top_k(user_query, rag_index, k=3)
-        context_list = [x["chunk_text"] for x in top_chunks]
-
-        # Step 9: Generate Final Answer with Summarization
-        final_answer = generate_answer(context_list, user_query, model_name="gpt-4")
-        st.subheader("Summaries")
-        st.write(final_answer)
-
-        # Step 10: Display References
-        st.subheader("References")
-        for item in top_chunks:
-            pmid_link = f"https://pubmed.ncbi.nlm.nih.gov/{item['pmid']}/"
-            st.markdown(f"- PMID [{item['pmid']}]({pmid_link})")
+        st.caption(f"{len(refined)} of {len(summaries)} articles")
+        for s in store.get_summaries(refined):
+            pmid_link = f"https://pubmed.ncbi.nlm.nih.gov/{s['pmid']}/"
+            st.markdown(f"- [{s['title']}]({pmid_link}) — {s['journal']}, {s['pubdate']}")
+
+    # Follow-up questions only cost one query embedding and one chat call
+    st.header("Follow-up Question")
+    question = st.text_input(
+        "Ask another question about these articles:",
+        help="Answered from the articles already found, without searching PubMed again."
+    )
+    if st.button("💬 Ask") and question.strip():
+        st.session_state["followup"] = build_followup_pipeline().run(
+            followup_state(state, question), trace_path=trace_path
+        )
+    followup = st.session_state.get("followup")
+    if followup:
+        render_result(followup)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,289 @@
+# benchmarks/fake_servers.py
+"""
+Local stand-ins for NCBI E-utilities and the OpenAI API, used by the benchmarks.
+
+Both servers answer with deterministic, synthetic payloads and can be configured with
+per-request latency, payload size and an error rate. ServerProcess runs them in a child
+process, so serving requests does not compete for the GIL with the code being timed.
+"""
+import json
+import time
+import random
+import hashlib
+import functools
+import threading
+import multiprocessing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+from xml.sax.saxutils import escape
+
+WORDS = (
+    "cancer cells doxorubicin microbiota electromagnetic field therapy apoptosis "
+    "proliferation signaling pathway expression mouse human tumor growth inhibition "
+    "synergy treatment response molecular mechanism oxidative stress"
+).split()
+
+MESH_HEADINGS = [
+    "Doxorubicin", "Neoplasms", "Apoptosis", "Cell Proliferation", "Microbiota",
+    "Electromagnetic Fields", "Mice", "Humans", "Oxidative Stress", "Signal Transduction",
+]
+
+
+class FakeServerConfig:
+    """
+    Behaviour knobs shared by the fake servers.
+
+    :param latency: Seconds to sleep before answering each request
+    :param payload_size: Approximate characters of text per article (titles/abstracts)
+    :param error_rate: Fraction of requests answered with an HTTP error (0.0-1.0)
+    :param embedding_dim: Length of the fake embedding vectors
+    :param seed: Seed for the error-injection RNG
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        payload_size: int = 1000,
+        error_rate: float = 0.0,
+        embedding_dim: int = 256,
+        seed: int = 0
+    ):
+        self.latency = latency
+        self.payload_size = payload_size
+        self.error_rate = error_rate
+        self.embedding_dim = embedding_dim
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            self.requests += 1
+            fail = self.error_rate > 0 and self._rng.random() < self.error_rate
+            if fail:
+                self.errors += 1
+            return fail
+
+
+def _digest(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def fake_text(seed: str, size: int) -> str:
+    """Deterministic pseudo-scientific text of roughly `size` characters."""
+    rng = random.Random(_digest(seed))
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)[:size]
+
+
+def fake_pmids(term: str, count: int) -> List[str]:
+    base = 10_000_000 + _digest(term) % 20_000_000
+    return [str(base + i) for i in range(count)]
+
+
+def fake_embedding(text: str, dim: int) -> List[float]:
+    rng = random.Random(_digest(text))
+    return [rng.uniform(-1.0, 1.0) for _ in range(dim)]
+
+
+@functools.lru_cache(maxsize=65536)
+def _embedding_json(text: str, dim: int) -> str:
+    # Repeated runs embed the same chunks; generate and encode each vector once
+    return json.dumps(fake_embedding(text, dim))
+
+
+def efetch_xml(pmids: List[str], payload_size: int) -> str:
+    """A PubmedArticleSet payload shaped like a real EFetch response."""
+    parts = ["<?xml version=\"1.0\"?>\n<PubmedArticleSet>"]
+    for pmid in pmids:
+        rng = random.Random(_digest(pmid))
+        headings = "".join(
+            f"<MeshHeading><DescriptorName UI=\"D{rng.randint(1, 99999):06d}\">{h}</DescriptorName></MeshHeading>"
+            for h in rng.sample(MESH_HEADINGS, 4)
+        )
+        parts.append(
+            "<PubmedArticle><MedlineCitation>"
+            f"<PMID>{pmid}</PMID><Article>"
+            f"<ArticleTitle>{escape(fake_text('title' + pmid, 120))}</ArticleTitle>"
+            f"<Abstract><AbstractText>{escape(fake_text('abstract' + pmid, payload_size))}</AbstractText></Abstract>"
+            f"</Article><MeshHeadingList>{headings}</MeshHeadingList>"
+            "</MedlineCitation></PubmedArticle>"
+        )
+    parts.append("</PubmedArticleSet>")
+    return "".join(parts)
+
+
+class _FakeHandler(BaseHTTPRequestHandler):
+    config: FakeServerConfig = FakeServerConfig()
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def _send(self, status: int, body: str, content_type: str = "application/json",
+              headers: Optional[Dict[str, str]] = None) -> None:
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _delay_or_fail(self) -> bool:
+        if self.config.latency:
+            time.sleep(self.config.latency)
+        if self.config.should_fail():
+            self._send(503, json.dumps({"error": "injected failure"}))
+            return True
+        return False
+
+
+class FakeEutilsHandler(_FakeHandler):
+    """Serves esearch/esummary/efetch/elink under /entrez/eutils/."""
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        endpoint = url.path.rsplit("/", 1)[-1]
+        if self._delay_or_fail():
+            return
+        size = self.config.payload_size
+
+        if endpoint == "esearch.fcgi":
+            ids = fake_pmids(params.get("term", ""), int(params.get("retmax", 20)))
+            if params.get("retmode") == "xml":
+                body = "<eSearchResult><IdList>" + "".join(f"<Id>{i}</Id>" for i in ids) + "</IdList></eSearchResult>"
+                self._send(200, body, "text/xml")
+            else:
+                self._send(200, json.dumps({"esearchresult": {"count": str(len(ids)), "idlist": ids}}))
+        elif endpoint == "esummary.fcgi":
+            ids = [i for i in params.get("id", "").split(",") if i]
+            result = {"uids": ids}
+            for pmid in ids:
+                rng = random.Random(_digest(pmid))
+                result[pmid] = {
+                    "uid": pmid,
+                    "title": fake_text("title" + pmid, min(size, 300)),
+                    "fulljournalname": f"Journal of {rng.choice(WORDS).title()} Research",
+                    "pubdate": f"{rng.randint(1995, 2024)} {rng.choice(['Jan', 'Mar', 'Jun', 'Oct'])} {rng.randint(1, 28)}",
+                    "pubstatus": rng.choice(["pubmed", "medline", "aheadofprint"]),
+                }
+            self._send(200, json.dumps({"result": result}))
+        elif endpoint == "efetch.fcgi":
+            ids = [i for i in params.get("id", "").split(",") if i]
+            self._send(200, efetch_xml(ids, size), "text/xml")
+        elif endpoint == "elink.fcgi":
+            pmid = params.get("id", "")
+            links = fake_pmids("related" + pmid, 10)
+            self._send(200, json.dumps({"linksets": [{"linksetdbs": [{"linkname": "pubmed_pubmed", "links": links}]}]}))
+        else:
+            self._send(404, json.dumps({"error": f"unknown endpoint {endpoint}"}))
+
+
+class FakeOpenAIHandler(_FakeHandler):
+    """Serves /v1/embeddings and /v1/chat/completions in the OpenAI response format."""
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if self._delay_or_fail():
+            return
+        headers = {
+            "x-ratelimit-limit-requests": "10000",
+            "x-ratelimit-remaining-requests": "9999",
+            "x-ratelimit-reset-requests": "6ms",
+            "x-ratelimit-limit-tokens": "10000000",
+            "x-ratelimit-remaining-tokens": "9999000",
+            "x-ratelimit-reset-tokens": "6ms",
+        }
+
+        if self.path.endswith("/embeddings"):
+            inputs = payload.get("input", [])
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            data = ",".join(
+                f'{{"object": "embedding", "index": {i}, '
+                f'"embedding": {_embedding_json(text, self.config.embedding_dim)}}}'
+                for i, text in enumerate(inputs)
+            )
+            tokens = sum(len(text) // 4 + 1 for text in inputs)
+            body = (
+                f'{{"object": "list", "data": [{data}], "model": {json.dumps(payload.get("model", "fake"))}, '
+                f'"usage": {{"prompt_tokens": {tokens}, "total_tokens": {tokens}}}}}'
+            )
+            self._send(200, body, headers=headers)
+        elif self.path.endswith("/chat/completions"):
+            prompt = " ".join(str(m.get("content", "")) for m in payload.get("messages", []))
+            content = ", ".join(WORDS[_digest(prompt) % 5: _digest(prompt) % 5 + 3])
+            prompt_tokens = len(prompt) // 4 + 1
+            body = {
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()),
+                "model": payload.get("model", "fake"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": 8,
+                          "total_tokens": prompt_tokens + 8},
+            }
+            self._send(200, json.dumps(body), headers=headers)
+        else:
+            self._send(404, json.dumps({"error": f"unknown path {self.path}"}))
+
+
+def start_server(handler_cls, config: FakeServerConfig) -> Tuple[ThreadingHTTPServer, str]:
+    """
+    Starts a fake server on a free localhost port in a daemon thread.
+
+    :return: (server, base_url); call server.shutdown() when done
+    """
+    handler = type(handler_cls.__name__, (handler_cls,), {"config": config})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    prefix = "/entrez/eutils" if issubclass(handler_cls, FakeEutilsHandler) else "/v1"
+    return server, f"http://{host}:{port}{prefix}"
+
+
+def _serve(config_kwargs: Dict, conn) -> None:
+    config = FakeServerConfig(**config_kwargs)
+    eutils, eutils_url = start_server(FakeEutilsHandler, config)
+    openai_server, openai_url = start_server(FakeOpenAIHandler, config)
+    conn.send((eutils_url, openai_url))
+    conn.recv()  # blocks until ServerProcess.stop()
+    eutils.shutdown()
+    openai_server.shutdown()
+    conn.send({"requests": config.requests, "errors": config.errors})
+
+
+class ServerProcess:
+    """
+    Both fake servers in a child process (FakeServerConfig arguments as keywords).
+    """
+
+    def __init__(self, **config_kwargs):
+        context = multiprocessing.get_context("spawn")
+        self._conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_serve, args=(config_kwargs, child_conn), daemon=True)
+        self.process.start()
+        self.eutils_url, self.openai_url = self._conn.recv()
+
+    def stop(self) -> Dict[str, int]:
+        """
+        Shuts the servers down.
+
+        :return: {"requests": ..., "errors": ...} counted by the servers
+        """
+        self._conn.send("stop")
+        stats = self._conn.recv()
+        self.process.join(timeout=5)
+        return stats
@@ -0,0 +1,243 @@
+# benchmarks/run_benchmarks.py
+"""
+End-to-end benchmarks against local fake NCBI / OpenAI servers, plus micro benchmarks.
+
+The fake servers run in a child process. The micro benchmarks replace create_embeddings
+with a precomputed stub, so they time chunking, indexing and scoring only.
+
+Usage:
+    python benchmarks/run_benchmarks.py                     # run and compare to baseline
+    python benchmarks/run_benchmarks.py --update-baseline   # store the results as the new baseline
+    python benchmarks/run_benchmarks.py --latency 0.2 --error-rate 0.05 --sizes 10,30
+
+Exits with status 1 if any benchmark's median is slower than the baseline by more than
+--tolerance (relative) and --min-delta (absolute seconds), or if every run of a benchmark
+failed. Failed runs (e.g. with --error-rate) are left out of the timings.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+from typing import Callable, Dict, List, Tuple
+from unittest.mock import patch
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.abspath(os.path.join(current_dir, ".."))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from benchmarks.fake_servers import ServerProcess, efetch_xml, fake_text
+
+DEFAULT_BASELINE = os.path.join(current_dir, "baseline.json")
+
+# Dimension of ada-002 embeddings, used by the stub so scoring costs what it does in production
+EMBEDDING_DIM = 1536
+
+
+def time_it(fn: Callable[[], object], repeat: int) -> Dict:
+    """
+    Times repeat calls of fn. Calls that raise are counted as failures and not timed, so fast
+    failures cannot pull the median down; the timing fields are None if every call failed.
+    """
+    timings = []
+    failures = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            fn()
+        except Exception:
+            failures += 1
+            continue
+        timings.append(time.perf_counter() - start)
+    return {
+        "median": statistics.median(timings) if timings else None,
+        "min": min(timings) if timings else None,
+        "mean": statistics.fmean(timings) if timings else None,
+        "runs": len(timings),
+        "failures": failures,
+    }
+
+
+def stub_create_embeddings(pool_size: int = 64, dim: int = EMBEDDING_DIM) -> Callable:
+    """
+    Drop-in for src.embeddings.create_embeddings that returns precomputed vectors without I/O.
+    """
+    rng = random.Random(0)
+    pool = [[rng.uniform(-1, 1) for _ in range(dim)] for _ in range(pool_size)]
+
+    def create_embeddings(chunks, model_name="text-embedding-ada-002", batch_size=64, priority=None):
+        return [(ch, pool[i % pool_size]) for i, ch in enumerate(chunks)]
+
+    return create_embeddings
+
+
+def run_micro_benchmarks(sizes: List[int], repeat: int, payload_size: int) -> Dict[str, Dict]:
+    with patch("src.rag_pipeline.create_embeddings", stub_create_embeddings()):
+        return _run_micro_benchmarks(sizes, repeat, payload_size)
+
+
+def _run_micro_benchmarks(sizes: List[int], repeat: int, payload_size: int) -> Dict[str, Dict]:
+    from src.rag_pipeline import chunk_text, build_index, build_index_streaming, find_top_k
+    from src.pubmed_api import parse_mesh_headings
+
+    results = {}
+    rng = random.Random(0)
+    for n in sizes:
+        text = fake_text(f"corpus{n}", n * payload_size)
+        results[f"chunk_text[n={n}]"] = time_it(lambda: chunk_text(text, chunk_size=500), repeat)
+
+        articles = [{"pmid": str(i), "abstract": fake_text(f"a{i}", payload_size)} for i in range(n)]
+        results[f"build_index[n={n}]"] = time_it(lambda: build_index(articles, chunk_size=500), repeat)
+        results[f"build_index_streaming[n={n}]"] = time_it(
+            lambda: sum(len(seg) for seg in build_index_streaming(iter(articles), chunk_size=500)), repeat
+        )
+
+        index = [
+            {"pmid": str(i), "chunk_text": f"chunk {i}", "embedding": [rng.uniform(-1, 1) for _ in range(EMBEDDING_DIM)]}
+            for i in range(n * 2)
+        ]
+        results[f"find_top_k[n={n}]"] = time_it(lambda: find_top_k("query", index, k=3), repeat)
+
+        xml = efetch_xml([str(20_000_000 + i) for i in range(n)], payload_size)
+        results[f"parse_mesh_headings[n={n}]"] = time_it(lambda: parse_mesh_headings(xml), repeat)
+    return results
+
+
+def run_pipeline_benchmarks(sizes: List[int], repeat: int) -> Dict[str, Dict]:
+    from src.pipeline import run_search
+
+    results = {}
+    for n in sizes:
+        stage_times: Dict[str, List[float]] = {}
+
+        def one_run():
+            result = run_search(
+                "PEMF stimulation assisting anticancer therapies based on doxorubicin",
+                retmax=n, use_keyword_extraction=True, use_synonyms=True,
+            )
+            for entry in result.trace_dicts():
+                stage_times.setdefault(entry["stage"], []).append(entry["wall_time"])
+
+        stats = time_it(one_run, repeat)
+        stats["stages"] = {name: statistics.median(t) for name, t in stage_times.items()}
+        results[f"pipeline[retmax={n}]"] = stats
+    return results
+
+
+def compare(
+    current: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float, min_delta: float
+) -> Tuple[List[str], List[str]]:
+    """
+    Compares current medians with the baseline.
+
+    :return: (one human-readable line per regression or fully failed benchmark,
+              names of current benchmarks the baseline has no entry for)
+    """
+    regressions, unbaselined = [], []
+    for name, stats in current.items():
+        now = stats["median"]
+        if now is None:
+            regressions.append(f"{name}: all {stats['failures']} runs failed")
+            continue
+        base = baseline.get(name)
+        if base is None or base.get("median") is None:
+            unbaselined.append(name)
+            continue
+        before = base["median"]
+        if now > before * (1 + tolerance) and now - before > min_delta:
+            regressions.append(f"{name}: {before * 1000:.2f} ms -> {now * 1000:.2f} ms ({now / before:.2f}x)")
+    return regressions, unbaselined
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="PubMed summarizer benchmarks")
+    parser.add_argument("--sizes", default="10,100,300", help="Corpus sizes for the micro benchmarks")
+    parser.add_argument("--pipeline-sizes", default="5,30", help="retmax values for the full pipeline runs")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.0, help="Fake server latency per request (s), pipeline runs only")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fake server error rate, pipeline runs only")
+    parser.add_argument("--payload-size", type=int, default=1000, help="Characters of text per fake article")
+    parser.add_argument("--embedding-dim", type=int, default=256, help="Length of the fake server's embeddings")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Allowed relative slowdown vs. baseline")
+    parser.add_argument("--min-delta", type=float, default=0.002, help="Ignore slowdowns smaller than this (s)")
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    # Only the pipeline runs talk to the servers, so latency and errors apply to them alone
+    servers = ServerProcess(
+        latency=args.latency, error_rate=args.error_rate,
+        payload_size=args.payload_size, embedding_dim=args.embedding_dim,
+    )
+    # Must be set before src is imported: the clients read them at import time
+    os.environ["NCBI_EUTILS_URL"] = servers.eutils_url
+    os.environ["OPENAI_BASE_URL"] = servers.openai_url
+    os.environ["OPENAI_API_KEY"] = "benchmark"
+
+    try:
+        sizes = [int(s) for s in args.sizes.split(",") if s]
+        benchmarks = run_micro_benchmarks(sizes, args.repeat, args.payload_size)
+
+        pipeline_sizes = [int(s) for s in args.pipeline_sizes.split(",") if s]
+        benchmarks.update(run_pipeline_benchmarks(pipeline_sizes, args.repeat))
+    finally:
+        server_stats = servers.stop()
+
+    report = {
+        "meta": {
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "latency": args.latency,
+            "error_rate": args.error_rate,
+            "payload_size": args.payload_size,
+            "embedding_dim": args.embedding_dim,
+            "fake_server_requests": server_stats["requests"],
+            "fake_server_errors": server_stats["errors"],
+        },
+        "benchmarks": benchmarks,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    for name, stats in benchmarks.items():
+        if stats["median"] is None:
+            print(f"{name:<36} all {stats['failures']} runs failed")
+            continue
+        failed = f"   ({stats['failures']} failed runs excluded)" if stats["failures"] else ""
+        print(f"{name:<36} median {stats['median'] * 1000:10.2f} ms   min {stats['min'] * 1000:10.2f} ms{failed}")
+    print(f"Results written to {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one")
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)["benchmarks"]
+    regressions, unbaselined = compare(benchmarks, baseline, args.tolerance, args.min_delta)
+    if unbaselined:
+        print("Not compared, no baseline entry (refresh with --update-baseline):")
+        for name in unbaselined:
+            print(f"  {name}")
+    if regressions:
+        print("Performance regressions against baseline:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print("No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,249 @@
+# batch.py
+"""
+Batch mode: many research questions against one shared article index.
+
+Keyword extraction, synonym expansion and the PubMed search run per question in
+parallel. The union of all PMIDs is then summarized once and embedded once into a
+shared index (one index per distinct chunk_size setting), and only retrieval and answer
+generation run per question, restricted to that question's own articles. Output is one
+JSON line per question.
+
+Run with: python -m src.batch questions.txt -o answers.jsonl --workers 8
+"""
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from src.metrics import StageStats, track
+from src.pubmed_api import get_summaries, filter_medline_summaries
+from src.pipeline import (
+    Pipeline, PipelineResult, new_state, keywords_step, synonyms_step, query_step, search_step,
+    articles_step, index_step, retrieve_step, answer_step
+)
+
+logger = logging.getLogger(__name__)
+
+# ESummary accepts many ids per request; keep the GET URL well below server limits
+SUMMARY_BATCH_SIZE = 200
+
+
+def load_questions(path: str) -> List[Dict]:
+    """
+    Reads questions from a text file (one per line) or JSONL ({"question": ..., "id": ..., "settings": {...}}).
+    Blank lines and lines starting with '#' are skipped.
+
+    :return: List of {"id", "question", "settings"} dicts
+    """
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                item = json.loads(line)
+                questions.append({
+                    "id": str(item.get("id", line_no)),
+                    "question": item["question"],
+                    "settings": item.get("settings", {}),
+                })
+            else:
+                questions.append({"id": str(line_no), "question": line, "settings": {}})
+    return questions
+
+
+def select_summaries_step(state: Dict) -> None:
+    # Pick this question's articles out of the shared ESummary results
+    shared = state["shared_summaries"]
+    summaries = [shared[p] for p in state["pmids"] if p in shared]
+    if state["filter_medline"]:
+        summaries = filter_medline_summaries(summaries)
+    state["summaries"] = summaries
+    if not summaries:
+        state["halt"] = "No articles found after applying MEDLINE filtering."
+
+
+def select_index_step(state: Dict) -> None:
+    # Restrict retrieval to chunks of this question's articles
+    pmids = {s["pmid"] for s in state["summaries"]}
+    state["rag_index"] = [item for item in state["shared_index"] if item["pmid"] in pmids]
+
+
+SEARCH_STEPS = [
+    ("extract_keywords", keywords_step),
+    ("synonyms", synonyms_step),
+    ("build_query", query_step),
+    ("search", search_step),
+]
+
+ANSWER_STEPS = [
+    ("select_summaries", select_summaries_step),
+    ("select_index", select_index_step),
+    ("retrieve", retrieve_step),
+    ("answer", answer_step),
+]
+
+
+def _error(e: Exception) -> str:
+    return f"{type(e).__name__}: {e}"
+
+
+def _record(question: Dict, search: Optional[PipelineResult], answer: Optional[PipelineResult],
+            shared_trace: List[Dict], error: Optional[str] = None) -> Dict:
+    state = answer.state if answer is not None else search.state if search is not None else {}
+    trace = (search.trace_dicts() if search is not None else []) + (answer.trace_dicts() if answer is not None else [])
+    return {
+        "id": question["id"],
+        "question": question["question"],
+        "error": error,
+        "halt": state.get("halt"),
+        "extracted": state.get("extracted"),
+        "query_str": state.get("query_str"),
+        "pmids": state.get("pmids", []),
+        "answer": state.get("answer"),
+        "references": [
+            {"pmid": c["pmid"], "chunk_text": c["chunk_text"]} for c in state.get("top_chunks", [])
+        ],
+        "timings": {entry["stage"]: entry["wall_time"] for entry in trace},
+        "trace": trace,
+        "shared_trace": shared_trace,
+    }
+
+
+def run_batch(questions: List[Dict], workers: int = 4, **settings) -> List[Dict]:
+    """
+    Answers many questions with a single fetch and embedding pass over their combined articles.
+
+    :param questions: Items from load_questions (or dicts with at least "question")
+    :param workers: Parallel per-question pipeline runs
+    :param settings: Pipeline settings applied to every question (per-question settings win).
+        Questions are grouped by their chunk_size, with one shared index built per group.
+    :return: One result record per question, in input order. A question whose pipeline raised
+        gets a record with an "error" message instead of aborting the batch.
+    """
+    questions = [
+        {"id": q.get("id", str(i)), "question": q["question"], "settings": q.get("settings", {})}
+        for i, q in enumerate(questions, start=1)
+    ]
+
+    errors: List[Optional[str]] = [None] * len(questions)
+
+    # Phase 1 (parallel per question): keywords, synonyms, query, PubMed search
+    def search_one(i: int) -> Optional[PipelineResult]:
+        q = questions[i]
+        try:
+            state = new_state(q["question"], **{**settings, **q["settings"]})
+            return Pipeline(SEARCH_STEPS).run(state)
+        except Exception as e:
+            logger.exception(f"Question {q['id']} failed during search")
+            errors[i] = _error(e)
+            return None
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        searches = list(executor.map(search_one, range(len(questions))))
+    searched = [i for i, s in enumerate(searches) if s is not None and not s.halted]
+
+    # Phase 2 (once): summaries for the union of all PMIDs
+    all_pmids = list(dict.fromkeys(p for i in searched for p in searches[i].state["pmids"]))
+    logger.info(f"Batch of {len(questions)} questions: {len(all_pmids)} unique PMIDs")
+
+    summary_stats = StageStats("shared_summaries")
+    summaries: List[Dict] = []
+    try:
+        with track(summary_stats):
+            for start in range(0, len(all_pmids), SUMMARY_BATCH_SIZE):
+                summaries.extend(get_summaries(all_pmids[start:start + SUMMARY_BATCH_SIZE]))
+    except Exception as e:
+        # Every question still waiting for an answer depends on the shared summaries
+        logger.exception("Shared summary phase failed")
+        for i in searched:
+            errors[i] = _error(e)
+        searched = []
+    shared_summaries = {s["pmid"]: s for s in summaries}
+    shared_trace = [summary_stats.to_dict()]
+
+    # Phase 2b (once per chunk size): embeddings for the articles of the questions using it
+    groups: Dict[int, List[int]] = {}
+    for i in searched:
+        groups.setdefault(searches[i].state["chunk_size"], []).append(i)
+    shared_indexes: Dict[int, List[Dict]] = {}
+    for chunk_size, members in groups.items():
+        index_stats = StageStats("shared_build_index")
+        pmids = {p for i in members for p in searches[i].state["pmids"]}
+        try:
+            # Index uses the same placeholder abstracts as the single-query pipeline
+            with track(index_stats):
+                shared = new_state("", **{**settings, "chunk_size": chunk_size})
+                shared["summaries"] = [s for s in summaries if s["pmid"] in pmids]
+                articles_step(shared)
+                index_step(shared)
+            shared_indexes[chunk_size] = shared["rag_index"]
+        except Exception as e:
+            logger.exception(f"Shared index phase failed for chunk_size={chunk_size}")
+            for i in members:
+                errors[i] = _error(e)
+        shared_trace.append({**index_stats.to_dict(), "chunk_size": chunk_size})
+    searched = [i for i in searched if errors[i] is None]
+
+    # Phase 3 (parallel per question): retrieval and answer over the question's own articles
+    def answer_one(i: int) -> Optional[PipelineResult]:
+        state = dict(searches[i].state)
+        state["shared_summaries"] = shared_summaries
+        state["shared_index"] = shared_indexes[state["chunk_size"]]
+        try:
+            return Pipeline(ANSWER_STEPS).run(state)
+        except Exception as e:
+            logger.exception(f"Question {questions[i]['id']} failed during answer")
+            errors[i] = _error(e)
+            return None
+
+    answers: List[Optional[PipelineResult]] = [None] * len(questions)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for i, answer in zip(searched, executor.map(answer_one, searched)):
+            answers[i] = answer
+
+    return [
+        _record(q, s, a, shared_trace, error)
+        for q, s, a, error in zip(questions, searches, answers, errors)
+    ]
+
+
+def write_jsonl(records: List[Dict], path: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+
+if __name__ == "__main__":
+    import os
+    import argparse
+    from src.pubmed_api import get_metadata_store, set_metadata_store
+    from src.metadata_store import open_metadata_store
+
+    parser = argparse.ArgumentParser(description="Answer a file of research questions in one batch")
+    parser.add_argument("questions", help="Text file (one question per line) or JSONL with a 'question' field")
+    parser.add_argument("-o", "--output", default="batch_results.jsonl")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--retmax", type=int, default=5)
+    parser.add_argument("--most-relevant", action="store_true")
+    parser.add_argument("--filter-medline", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    metadata_store_path = os.getenv("METADATA_STORE_PATH", "")
+    if metadata_store_path:
+        set_metadata_store(open_metadata_store(metadata_store_path))
+
+    records = run_batch(
+        load_questions(args.questions),
+        workers=args.workers,
+        retmax=args.retmax,
+        most_relevant=args.most_relevant,
+        filter_medline=args.filter_medline,
+    )
+    write_jsonl(records, args.output)
+    if metadata_store_path:
+        get_metadata_store().save(metadata_store_path)
+    failed = sum(1 for r in records if r["error"])
+    print(f"Wrote {len(records)} records to {args.output} ({failed} failed)")
@@ -0,0 +1,75 @@
+# deadline.py
+"""
+Deadline and cancellation scope for upstream calls.
+
+Pipeline.run enters scope() around every stage; the NCBI and OpenAI helpers read it to
+cap their timeouts, and the OpenAI scheduler stops waiting for a slot or a retry once the
+deadline passes or the run is cancelled. Outside a scope nothing is limited.
+"""
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Optional
+
+_scope: contextvars.ContextVar = contextvars.ContextVar("deadline_scope", default=(None, None))
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    Raised when an upstream call would start or keep waiting past the scope's deadline.
+    """
+
+
+class Cancelled(Exception):
+    """
+    Raised when the scope's cancel event is set while waiting to make an upstream call.
+    """
+
+
+@contextmanager
+def scope(deadline: Optional[float], cancel_event: Optional[threading.Event] = None):
+    """
+    Applies a deadline (a time.monotonic() value) and/or cancel event to calls made in this context.
+    """
+    token = _scope.set((deadline, cancel_event))
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def time_left() -> Optional[float]:
+    """
+    Seconds until the current deadline (possibly negative), or None without a deadline.
+    """
+    deadline = _scope.get()[0]
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def check() -> None:
+    """
+    :raises Cancelled: When the current scope has been cancelled
+    :raises DeadlineExceeded: When the current deadline has passed
+    """
+    deadline, cancel_event = _scope.get()
+    if cancel_event is not None and cancel_event.is_set():
+        raise Cancelled("Cancelled while waiting for an upstream call")
+    if deadline is not None and time.monotonic() >= deadline:
+        raise DeadlineExceeded("Deadline passed while waiting for an upstream call")
+
+
+def sleep(seconds: float) -> None:
+    """
+    time.sleep() that wakes up early on cancellation and raises instead of sleeping past the deadline.
+    """
+    check()
+    left = time_left()
+    if left is not None and left < seconds:
+        seconds = left
+    cancel_event = _scope.get()[1]
+    if cancel_event is not None:
+        cancel_event.wait(seconds)
+    else:
+        time.sleep(seconds)
+    check()
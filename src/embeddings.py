@@ -1,22 +1,40 @@
 # embeddings.py
 import os
-from openai import OpenAI
 from typing import List, Tuple
+from .metrics import record_usage
+from .singleflight import coalesce
+from .rate_limiter import BACKGROUND, estimate_tokens, get_scheduler, request_timeout, scheduled_client
 
 # Instantiate the OpenAI client at the module level
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY", ""))
+client = scheduled_client(api_key=os.getenv("OPENAI_API_KEY", ""))
 
-def create_embeddings(chunks: List[str], model_name: str = "text-embedding-ada-002") -> List[Tuple[str, List[float]]]:
+@coalesce("embeddings")
+def create_embeddings(
+    chunks: List[str],
+    model_name: str = "text-embedding-ada-002",
+    batch_size: int = 64,
+    priority: int = BACKGROUND
+) -> List[Tuple[str, List[float]]]:
     """
     Creates embeddings for each text chunk using OpenAI Embeddings (v1.x).
 
     :param chunks: List of strings (chunks) to convert into embeddings
     :param model_name: Name of the embedding model, e.g., "text-embedding-ada-002"
+    :param batch_size: Number of chunks sent per embeddings request
+    :param priority: Scheduling priority (see src.rate_limiter); query embeddings use INTERACTIVE
     :return: List of tuples (chunk_text, embedding_vector)
     """
     results = []
-    for ch in chunks:
-        response = client.embeddings.create(input=ch, model=model_name)
-        embedding = response.data[0].embedding
-        results.append((ch, embedding))
-    return results
\ No newline at end of file
+    for start in range(0, len(chunks), batch_size):
+        batch = chunks[start:start + batch_size]
+        response = get_scheduler().call(
+            lambda: client.embeddings.create(input=batch, model=model_name, timeout=request_timeout()),
+            priority=priority,
+            est_tokens=estimate_tokens(batch),
+            model=model_name
+        )
+        record_usage(response)
+        # The API returns one item per input, in input order
+        for ch, item in zip(batch, response.data):
+            results.append((ch, item.embedding))
+    return results
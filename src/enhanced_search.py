@@ -1,9 +1,16 @@
 # src/enhanced_search.py
-from src.pubmed_api import search_pubmed
-from typing import List, Dict
-import openai
+from src.pubmed_api import search_pubmed, http_get, EUTILS_BASE_URL
+from src.mesh_index import MeshIndex
+from src.metrics import record, record_usage
+from src.singleflight import coalesce
+from src.rate_limiter import NORMAL, estimate_tokens, get_scheduler, request_timeout, scheduled_client
+from typing import List, Dict, Optional
+import os
 
+client = scheduled_client(api_key=os.getenv("OPENAI_API_KEY", ""))
 
+
+@coalesce("chat_synonyms")
 def get_synonyms_dict_gpt(extracted_keywords: str, model_name="gpt-4") -> Dict[str, list]:
     """
     Dynamically calls GPT to find synonyms/related terms for each extracted keyword.
@@ -41,16 +48,24 @@ def get_synonyms_dict_gpt(extracted_keywords: str, model_name="gpt-4") -> Dict[s
             "No filler words, just synonyms or expansions, comma-separated."
         )
 
-        # Call ChatCompletion
-        response = openai.chat.completions.create(
-            model=model_name,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_content}
-            ],
-            temperature=0.2,
-            max_tokens=100
+        # Call ChatCompletion (through the shared rate-limit scheduler)
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_content}
+        ]
+        response = get_scheduler().call(
+            lambda: client.chat.completions.create(
+                model=model_name,
+                messages=messages,
+                temperature=0.2,
+                max_tokens=100,
+                timeout=request_timeout()
+            ),
+            priority=NORMAL,
+            est_tokens=estimate_tokens(messages, 100),
+            model=model_name
         )
+        record_usage(response)
 
         raw_output = response.choices[0].message.content.strip()
         # Parse synonyms from the comma-separated string
@@ -79,21 +94,22 @@ def do_two_phase_search(base_query: str, start_date: str, end_date: str, retmax:
     pmids = list(set(pmids + related_pmids))
     return pmids
 
+@coalesce("elink")
 def get_related_pmids(pmid: str) -> List[str]:
     """
     Example: ELink neighbor approach
     E.g. https://eutils.ncbi.nlm.nih.gov/entrez/eutils/elink.fcgi?dbfrom=pubmed&id=PMID&cmd=neighbor
     parse the result for LinkSetDb, LinkName=pubmed_pubmed
     """
-    import requests
-    base_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/elink.fcgi"
+    base_url = f"{EUTILS_BASE_URL}/elink.fcgi"
     params = {
         "dbfrom": "pubmed",
         "id": pmid,
         "cmd": "neighbor",
         "retmode": "json"
     }
-    r = requests.get(base_url, params=params)
+    r = http_get(base_url, params=params)
+    record(api_calls=1, bytes_downloaded=len(r.content))
     data = r.json()
     # parse the data to get related pmids
     related_ids = []
@@ -106,12 +122,20 @@ def get_related_pmids(pmid: str) -> List[str]:
                     related_ids.append(str(link))
     return related_ids
 
-def build_refined_query_with_mesh(main_terms: List[str], synonyms_dict: Dict[str, list]) -> str:
+def build_refined_query_with_mesh(
+    main_terms: List[str],
+    synonyms_dict: Dict[str, list],
+    mesh_index: Optional[MeshIndex] = None,
+    mesh_limit: int = 3
+) -> str:
     """
     Builds a structured PubMed query with proper grouping and inclusion of MeSH terms.
     
     :param main_terms: List of primary keywords.
     :param synonyms_dict: Dictionary mapping keywords to their synonyms and MeSH terms.
+    :param mesh_index: Optional local MeSH lookup (src.mesh_index.MeshIndex); matched
+                       headings are added to each term's clause as [MeSH Terms].
+    :param mesh_limit: Maximum number of MeSH headings added per term.
     :return: A well-formatted PubMed search query string.
     """
     or_clauses = []
@@ -121,6 +145,9 @@ def build_refined_query_with_mesh(main_terms: List[str], synonyms_dict: Dict[str
         combined_terms = [term] + synonyms
         # Escape quotes and ensure proper formatting
         formatted_terms = [f'"{t}"' for t in combined_terms if t]
+        if mesh_index is not None:
+            headings = mesh_index.mesh_headings(term, limit=mesh_limit)
+            formatted_terms += [f'"{h}"[MeSH Terms]' for h in headings]
         if formatted_terms:
             or_clause = " OR ".join(formatted_terms)
             or_clauses.append(f"({or_clause})")
@@ -1,5 +1,11 @@
-import openai
+import os
+from src.metrics import record_usage
+from src.singleflight import coalesce
+from src.rate_limiter import NORMAL, estimate_tokens, get_scheduler, request_timeout, scheduled_client
 
+client = scheduled_client(api_key=os.getenv("OPENAI_API_KEY", ""))
+
+@coalesce("chat_keywords")
 def extract_keywords(user_prompt: str, model_name: str = "gpt-4") -> str:
     """
     Uses ChatCompletion to interpret the user's natural language prompt 
@@ -29,14 +35,21 @@ def extract_keywords(user_prompt: str, model_name: str = "gpt-4") -> str:
         },
     ]
 
-    response = openai.chat.completions.create(
-        model=model_name,
-        messages=messages,
-        temperature=0.0,
-        top_p=1.0,
-        frequency_penalty=1.0,
-        presence_penalty=0.0
+    response = get_scheduler().call(
+        lambda: client.chat.completions.create(
+            model=model_name,
+            messages=messages,
+            temperature=0.0,
+            top_p=1.0,
+            frequency_penalty=1.0,
+            presence_penalty=0.0,
+            timeout=request_timeout()
+        ),
+        priority=NORMAL,
+        est_tokens=estimate_tokens(messages, 50),
+        model=model_name
     )
+    record_usage(response)
 
     keywords_str = response.choices[0].message.content.strip()
     return keywords_str
\ No newline at end of file
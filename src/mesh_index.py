@@ -0,0 +1,283 @@
+# mesh_index.py
+import os
+import mmap
+import struct
+import sys
+import logging
+from array import array
+from bisect import bisect_left
+from typing import List, Dict, Optional, Tuple
+import xml.etree.ElementTree as ET
+
+logger = logging.getLogger(__name__)
+
+# File layout (all integers are native-endian uint32, sections padded to 4 bytes):
+#   header   : magic, byte order flag, counts and blob lengths
+#   desc     : offsets[n_desc + 1], blob of "UI\x1fName\x1fTree1\x1eTree2..."
+#   terms    : offsets[n_terms + 1], blob of sorted normalized entry terms, desc ids[n_terms]
+#   trees    : offsets[n_trees + 1], blob of sorted tree numbers, desc ids[n_trees]
+_MAGIC = b"MESHIDX1"
+_HEADER = struct.Struct("<8s1s3x6I")
+_BYTE_ORDER = b"L" if sys.byteorder == "little" else b"B"
+_FIELD_SEP = "\x1f"
+_TREE_SEP = "\x1e"
+
+
+def normalize_term(term: str) -> str:
+    """
+    Normalizes a keyword or MeSH entry term for lookup (casefold, collapsed whitespace).
+    """
+    return " ".join(term.casefold().split())
+
+
+def _padding(length: int) -> bytes:
+    return b"\x00" * (-length % 4)
+
+
+def _offsets_and_blob(keys: List[bytes]) -> Tuple[array, bytes]:
+    offsets = array("I", [0])
+    for key in keys:
+        offsets.append(offsets[-1] + len(key))
+    return offsets, b"".join(keys)
+
+
+def build_mesh_index(xml_path: str, out_path: str) -> int:
+    """
+    Builds a compact, mmap-able MeSH lookup file from the NLM descriptor XML (descYYYY.xml).
+
+    :param xml_path: Path to the MeSH descriptor XML file
+    :param out_path: Path of the index file to write
+    :return: Number of descriptors written
+    """
+    descriptors = []
+    term_pairs = set()
+    tree_pairs = set()
+
+    # iterparse keeps memory flat on the full ~300 MB descriptor file
+    for _, elem in ET.iterparse(xml_path, events=("end",)):
+        if elem.tag != "DescriptorRecord":
+            continue
+        ui = elem.findtext("DescriptorUI", default="").strip()
+        name = elem.findtext("DescriptorName/String", default="").strip()
+        trees = [t.text.strip() for t in elem.findall("TreeNumberList/TreeNumber") if t.text]
+        if ui and name:
+            desc_id = len(descriptors)
+            descriptors.append(_FIELD_SEP.join([ui, name, _TREE_SEP.join(trees)]).encode("utf-8"))
+            term_pairs.add((normalize_term(name).encode("utf-8"), desc_id))
+            for term in elem.findall("ConceptList/Concept/TermList/Term/String"):
+                if term.text:
+                    term_pairs.add((normalize_term(term.text).encode("utf-8"), desc_id))
+            for tree in trees:
+                tree_pairs.add((tree.encode("utf-8"), desc_id))
+        elem.clear()
+
+    sorted_terms = sorted(term_pairs)
+    sorted_trees = sorted(tree_pairs)
+    desc_offsets, desc_blob = _offsets_and_blob(descriptors)
+    term_offsets, term_blob = _offsets_and_blob([k for k, _ in sorted_terms])
+    tree_offsets, tree_blob = _offsets_and_blob([k for k, _ in sorted_trees])
+
+    with open(out_path, "wb") as f:
+        f.write(_HEADER.pack(
+            _MAGIC, _BYTE_ORDER,
+            len(descriptors), len(sorted_terms), len(sorted_trees),
+            len(desc_blob), len(term_blob), len(tree_blob),
+        ))
+        for offsets, blob, ids in (
+            (desc_offsets, desc_blob, None),
+            (term_offsets, term_blob, array("I", [d for _, d in sorted_terms])),
+            (tree_offsets, tree_blob, array("I", [d for _, d in sorted_trees])),
+        ):
+            f.write(offsets.tobytes())
+            f.write(blob + _padding(len(blob)))
+            if ids is not None:
+                f.write(ids.tobytes())
+
+    logger.info(f"MeSH index written to {out_path}: {len(descriptors)} descriptors, "
+                f"{len(sorted_terms)} entry terms, {len(sorted_trees)} tree numbers")
+    return len(descriptors)
+
+
+class _KeyTable:
+    """
+    Read-only sorted sequence of byte keys backed by an mmap, usable with bisect.
+    """
+
+    def __init__(self, buf: memoryview, offsets: memoryview):
+        self._buf = buf
+        self._offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i: int) -> bytes:
+        return bytes(self._buf[self._offsets[i]:self._offsets[i + 1]])
+
+
+class MeshIndex:
+    """
+    Local MeSH descriptor lookup over a file written by build_mesh_index.
+
+    Opening only maps the file and reads the header, so it loads in milliseconds;
+    lookups are binary searches over the mapped, pre-sorted keys.
+    """
+
+    def __init__(self, path: str):
+        """
+        :raises ValueError: When path is not a complete MeSH index file for this machine
+        """
+        self._path = path
+        self._file = open(path, "rb")
+        self._mm = None
+        self._views: List[memoryview] = []
+        try:
+            self._open(path)
+        except BaseException:
+            self.close()
+            raise
+
+    def _open(self, path: str) -> None:
+        if os.fstat(self._file.fileno()).st_size < _HEADER.size:
+            raise ValueError(f"{path} is not a MeSH index file (too short)")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, byte_order, n_desc, n_terms, n_trees, desc_len, term_len, tree_len = \
+            _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not a MeSH index file")
+        if byte_order != _BYTE_ORDER:
+            raise ValueError(f"{path} was built on a machine with a different byte order")
+
+        pos = _HEADER.size
+        self._desc_offsets, self._desc_blob, _, pos = self._section(pos, n_desc, desc_len, with_ids=False)
+        term_offsets, term_blob, self._term_ids, pos = self._section(pos, n_terms, term_len)
+        tree_offsets, tree_blob, self._tree_ids, pos = self._section(pos, n_trees, tree_len)
+        self._terms = _KeyTable(term_blob, term_offsets)
+        self._trees = _KeyTable(tree_blob, tree_offsets)
+
+    def _view(self, start: int, end: int, fmt: Optional[str] = None) -> memoryview:
+        view = memoryview(self._mm)[start:end]
+        if fmt:
+            view = view.cast(fmt)
+        self._views.append(view)
+        return view
+
+    def _section(self, pos: int, count: int, blob_len: int, with_ids: bool = True):
+        offsets_end = pos + 4 * (count + 1)
+        end = offsets_end + blob_len + (-blob_len % 4 + 4 * count if with_ids else 0)
+        if end > len(self._mm):
+            raise ValueError(f"{self._path} is a truncated MeSH index file")
+        offsets = self._view(pos, offsets_end, "I")
+        blob = self._view(offsets_end, offsets_end + blob_len)
+        pos = offsets_end + blob_len + (-blob_len % 4)
+        ids = None
+        if with_ids:
+            ids = self._view(pos, pos + 4 * count, "I")
+            pos += 4 * count
+        return offsets, blob, ids, pos
+
+    def __len__(self) -> int:
+        return len(self._desc_offsets) - 1
+
+    def __enter__(self) -> "MeshIndex":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        if self._mm is not None:
+            self._mm.close()
+        self._file.close()
+
+    def descriptor(self, desc_id: int) -> Dict:
+        """
+        Returns a descriptor record as {"ui", "name", "tree_numbers"}.
+        """
+        raw = bytes(self._desc_blob[self._desc_offsets[desc_id]:self._desc_offsets[desc_id + 1]])
+        ui, name, trees = raw.decode("utf-8").split(_FIELD_SEP)
+        return {"ui": ui, "name": name, "tree_numbers": trees.split(_TREE_SEP) if trees else []}
+
+    def _collect(self, keys: _KeyTable, ids: memoryview, lo: int, match, limit: Optional[int]) -> List[Dict]:
+        found = []
+        seen = set()
+        i = lo
+        while i < len(keys) and match(keys[i]):
+            if ids[i] not in seen:
+                seen.add(ids[i])
+                found.append(ids[i])
+                if limit is not None and len(found) >= limit:
+                    break
+            i += 1
+        return [self.descriptor(d) for d in found]
+
+    def lookup(self, term: str) -> List[Dict]:
+        """
+        Exact (normalized) match on descriptor names and entry terms.
+        """
+        key = normalize_term(term).encode("utf-8")
+        lo = bisect_left(self._terms, key)
+        return self._collect(self._terms, self._term_ids, lo, lambda k: k == key, None)
+
+    def search_prefix(self, prefix: str, limit: Optional[int] = 10) -> List[Dict]:
+        """
+        Descriptors whose name or any entry term starts with the given prefix.
+        """
+        key = normalize_term(prefix).encode("utf-8")
+        if not key:
+            return []
+        lo = bisect_left(self._terms, key)
+        return self._collect(self._terms, self._term_ids, lo, lambda k: k.startswith(key), limit)
+
+    def descendants(self, tree_number: str, limit: Optional[int] = None) -> List[Dict]:
+        """
+        Descriptors at the given tree number or anywhere below it (e.g. "C04" for all neoplasms).
+        """
+        key = tree_number.strip().encode("utf-8")
+        if not key:
+            return []
+        child = key + b"."
+        lo = bisect_left(self._trees, key)
+        return self._collect(
+            self._trees, self._tree_ids, lo, lambda k: k == key or k.startswith(child), limit
+        )
+
+    def mesh_headings(self, keyword: str, limit: int = 3) -> List[str]:
+        """
+        Local replacement for pubmed_api.fetch_mesh_terms: maps a keyword to MeSH headings.
+        Exact entry-term matches win; otherwise falls back to a prefix search.
+
+        :param keyword: The search keyword.
+        :param limit: The maximum number of headings to return.
+        :return: A list of MeSH descriptor names.
+        """
+        matches = self.lookup(keyword) or self.search_prefix(keyword, limit=limit)
+        return [d["name"] for d in matches[:limit]]
+
+
+def load_mesh_index(path: str) -> MeshIndex:
+    """
+    Opens a MeSH index file written by build_mesh_index.
+    """
+    return MeshIndex(path)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Build a local MeSH lookup from descYYYY.xml")
+    parser.add_argument("xml_path", help="NLM MeSH descriptor XML, e.g. desc2025.xml")
+    parser.add_argument("out_path", help="Output index file, e.g. data/mesh.idx")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    count = build_mesh_index(args.xml_path, args.out_path)
+    print(f"Indexed {count} descriptors in {time.perf_counter() - t0:.1f}s")
+
+    t0 = time.perf_counter()
+    with load_mesh_index(args.out_path) as idx:
+        print(f"Loaded in {(time.perf_counter() - t0) * 1000:.2f} ms")
@@ -0,0 +1,366 @@
+# metadata_store.py
+"""
+Local columnar store of article metadata (PMID, title, journal, pubdate, pubstatus, MeSH ids).
+
+Any fetch path can fill it (ESummary results via add_summaries, EFetch XML via
+add_efetch_xml); pubmed_api.get_summaries then only downloads PMIDs it has not seen.
+Filtering by date range, status, journal or MeSH id runs as numpy mask operations over
+the columns, so re-filtering known results needs no network. The store persists to a
+single .npz file with no pickled objects.
+"""
+import os
+import re
+import time
+import logging
+import tempfile
+import zipfile
+import calendar
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MEDLINE_STATUSES = ("pubmed", "medline")
+
+# pubstatus and titles change after publication (aheadofprint -> medline), so rows are
+# re-fetched once older than this
+DEFAULT_MAX_AGE = 7 * 24 * 3600.0
+
+_MONTHS = {m: i for i, m in enumerate(
+    ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"], start=1
+)}
+# Seasonal issue dates are mapped to the first month of the season
+_SEASONS = {"spring": 3, "summer": 6, "fall": 9, "autumn": 9, "winter": 12}
+
+
+def _month(token: str) -> Optional[int]:
+    return _MONTHS.get(token[:3]) or _SEASONS.get(token)
+
+
+def _day(token: str, year: int, month: int) -> Optional[int]:
+    if len(token) <= 2 and token.isdigit() and 1 <= int(token) <= calendar.monthrange(year, month)[1]:
+        return int(token)
+    return None
+
+
+def parse_pubdate(pubdate: str) -> Tuple[int, int]:
+    """
+    Parses an ESummary pubdate ("2023 Jan 15", "2023 Jan-Feb", "2023 Dec 15-21", "2022 Winter",
+    "2023 Dec-2024 Jan", "2023") into the (first, last) day it may refer to, as YYYYMMDD
+    integers. Returns (0, 0) if unparseable.
+    """
+    tokens = [t for t in re.split(r"[\s\-/]+", (pubdate or "").strip().lower()) if t]
+    if not tokens or not re.fullmatch(r"\d{4}", tokens[0]):
+        return 0, 0
+    year = int(tokens[0])
+    rest = tokens[1:]
+
+    month = _month(rest[0]) if rest else None
+    if month is None:
+        end_year = int(rest[0]) if rest and re.fullmatch(r"\d{4}", rest[0]) else year
+        return year * 10000 + 101, max(year, end_year) * 10000 + 1231
+    rest = rest[1:]
+    day = _day(rest[0], year, month) if rest else None
+    if day is not None:
+        rest = rest[1:]
+
+    # Whatever follows is the end of a range: [year] [month] [day]
+    end_year, end_month, end_day = year, month, day
+    if rest and re.fullmatch(r"\d{4}", rest[0]):
+        end_year, rest = int(rest[0]), rest[1:]
+    if rest and _month(rest[0]) is not None:
+        end_month, end_day, rest = _month(rest[0]), None, rest[1:]
+    if rest and _day(rest[0], end_year, end_month) is not None:
+        end_day = _day(rest[0], end_year, end_month)
+
+    first = year * 10000 + month * 100 + (day or 1)
+    last = end_year * 10000 + end_month * 100 + (end_day or calendar.monthrange(end_year, end_month)[1])
+    return first, max(first, last)
+
+
+def _date_key(date: str) -> int:
+    # "YYYY/MM/DD" (PubMed format) or "YYYY-MM-DD" -> YYYYMMDD
+    return int(date.replace("/", "").replace("-", "")) if date else 0
+
+
+def _mesh_number(ui: str) -> int:
+    # "D012345" -> 12345
+    return int(ui[1:]) if ui and ui[1:].isdigit() else 0
+
+
+def _pack_strings(values: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    encoded = [v.encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(e) for e in encoded])
+    return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+
+def _unpack_strings(offsets: np.ndarray, blob: np.ndarray) -> List[str]:
+    raw = blob.tobytes()
+    return [raw[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+
+class _Vocab:
+    """
+    String <-> integer code mapping for a categorical column.
+    """
+
+    def __init__(self, values: Optional[List[str]] = None):
+        self.values: List[str] = list(values or [])
+        self.codes: Dict[str, int] = {v: i for i, v in enumerate(self.values)}
+
+    def code(self, value: str) -> int:
+        if value not in self.codes:
+            self.codes[value] = len(self.values)
+            self.values.append(value)
+        return self.codes[value]
+
+    def lookup(self, values: Iterable[str]) -> np.ndarray:
+        return np.array([self.codes[v] for v in values if v in self.codes], dtype=np.int32)
+
+
+class ArticleMetadataStore:
+    """
+    Columnar article metadata with vectorized filtering. Thread-safe.
+
+    :param max_age: Seconds after which a row counts as missing again (None: never)
+    """
+
+    def __init__(self, max_age: Optional[float] = DEFAULT_MAX_AGE):
+        self.max_age = max_age
+        self._lock = threading.RLock()
+        self._row: Dict[str, int] = {}
+        self.pmids: List[str] = []
+        self.titles: List[str] = []
+        self.pubdates: List[str] = []
+        self.date_first = np.zeros(0, dtype=np.int32)
+        self.date_last = np.zeros(0, dtype=np.int32)
+        self.status = np.zeros(0, dtype=np.int32)
+        self.journal = np.zeros(0, dtype=np.int32)
+        self.fetched_at = np.zeros(0, dtype=np.float64)
+        self.mesh: List[np.ndarray] = []
+        self.status_vocab = _Vocab()
+        self.journal_vocab = _Vocab()
+
+    def __len__(self) -> int:
+        return len(self.pmids)
+
+    def __contains__(self, pmid: str) -> bool:
+        return pmid in self._row
+
+    def missing(self, pmids: Iterable[str]) -> List[str]:
+        """
+        PMIDs not yet in the store or fetched more than max_age seconds ago, in input order.
+        """
+        with self._lock:
+            if self.max_age is None:
+                return [p for p in pmids if p not in self._row]
+            oldest = time.time() - self.max_age
+            return [p for p in pmids if p not in self._row or self.fetched_at[self._row[p]] < oldest]
+
+    # --- Filling ---
+
+    def add_summaries(self, summaries: List[Dict]) -> None:
+        """
+        Inserts or updates rows from pubmed_api.get_summaries output.
+        """
+        with self._lock:
+            now = time.time()
+            new_rows = []
+            for s in summaries:
+                first, last = parse_pubdate(s.get("pubdate", ""))
+                status = self.status_vocab.code(s.get("pubstatus", "").lower())
+                journal = self.journal_vocab.code(s.get("journal", ""))
+                row = self._row.get(s["pmid"])
+                if row is None:
+                    self._row[s["pmid"]] = len(self.pmids)
+                    self.pmids.append(s["pmid"])
+                    self.titles.append(s.get("title", ""))
+                    self.pubdates.append(s.get("pubdate", ""))
+                    self.mesh.append(np.zeros(0, dtype=np.int32))
+                    new_rows.append((first, last, status, journal))
+                else:
+                    self.titles[row] = s.get("title", "")
+                    self.pubdates[row] = s.get("pubdate", "")
+                    self.date_first[row], self.date_last[row] = first, last
+                    self.status[row], self.journal[row] = status, journal
+                    self.fetched_at[row] = now
+            if new_rows:
+                columns = np.array(new_rows, dtype=np.int32).reshape(-1, 4)
+                self.date_first = np.concatenate([self.date_first, columns[:, 0]])
+                self.date_last = np.concatenate([self.date_last, columns[:, 1]])
+                self.status = np.concatenate([self.status, columns[:, 2]])
+                self.journal = np.concatenate([self.journal, columns[:, 3]])
+                self.fetched_at = np.concatenate([self.fetched_at, np.full(len(new_rows), now)])
+
+    def add_mesh(self, mesh_by_pmid: Dict[str, List[str]]) -> None:
+        """
+        Sets the MeSH descriptor UIs ("D012345") of PMIDs already in the store.
+        """
+        with self._lock:
+            for pmid, uis in mesh_by_pmid.items():
+                row = self._row.get(pmid)
+                if row is not None:
+                    self.mesh[row] = np.array(sorted({_mesh_number(ui) for ui in uis} - {0}), dtype=np.int32)
+
+    def add_efetch_xml(self, efetch_xml) -> None:
+        """
+        Records MeSH descriptor UIs from an EFetch PubmedArticleSet payload.
+        """
+        root = ET.fromstring(efetch_xml)
+        mesh_by_pmid = {}
+        for article in root.findall(".//PubmedArticle"):
+            pmid = article.findtext(".//MedlineCitation/PMID")
+            if pmid:
+                mesh_by_pmid[pmid] = [
+                    d.get("UI", "") for d in article.findall(".//MeshHeading/DescriptorName")
+                ]
+        self.add_mesh(mesh_by_pmid)
+
+    # --- Reading ---
+
+    def get_summaries(self, pmids: Iterable[str]) -> List[Dict]:
+        """
+        Rows in pubmed_api.get_summaries format, in input order, skipping unknown PMIDs.
+        """
+        with self._lock:
+            result = []
+            for pmid in pmids:
+                row = self._row.get(pmid)
+                if row is None:
+                    continue
+                result.append({
+                    "pmid": pmid,
+                    "title": self.titles[row],
+                    "journal": self.journal_vocab.values[self.journal[row]],
+                    "pubdate": self.pubdates[row],
+                    "pubstatus": self.status_vocab.values[self.status[row]],
+                })
+            return result
+
+    def mask(
+        self,
+        start_date: str = "",
+        end_date: str = "",
+        statuses: Optional[Iterable[str]] = None,
+        journals: Optional[Iterable[str]] = None,
+        mesh_ids: Optional[Iterable[str]] = None
+    ) -> np.ndarray:
+        """
+        Boolean mask over all rows. Dates are "YYYY/MM/DD" or "YYYY-MM-DD"; an article matches
+        a date range if any day its pubdate may refer to falls inside it (as PubMed's [dp]).
+        """
+        with self._lock:
+            keep = np.ones(len(self.pmids), dtype=bool)
+            if start_date:
+                keep &= self.date_last >= _date_key(start_date)
+            if end_date:
+                keep &= (self.date_first <= _date_key(end_date)) & (self.date_first > 0)
+            if statuses is not None:
+                keep &= np.isin(self.status, self.status_vocab.lookup(s.lower() for s in statuses))
+            if journals is not None:
+                keep &= np.isin(self.journal, self.journal_vocab.lookup(journals))
+            if mesh_ids is not None:
+                wanted = np.array([_mesh_number(ui) for ui in mesh_ids], dtype=np.int32)
+                lengths = np.fromiter((len(m) for m in self.mesh), dtype=np.int64, count=len(self.mesh))
+                flat = np.concatenate(self.mesh) if self.mesh else np.zeros(0, dtype=np.int32)
+                hits = np.isin(flat, wanted)
+                rows = np.repeat(np.arange(len(self.mesh)), lengths)
+                keep &= np.bincount(rows[hits], minlength=len(self.mesh)) > 0
+            return keep
+
+    def filter(self, pmids: Optional[Iterable[str]] = None, **criteria) -> List[str]:
+        """
+        PMIDs matching the criteria of mask(); restricted to (and ordered as) `pmids` if given.
+        Unknown PMIDs are dropped.
+        """
+        with self._lock:
+            keep = self.mask(**criteria)
+            if pmids is None:
+                return [self.pmids[i] for i in np.flatnonzero(keep)]
+            rows = np.array([self._row[p] for p in pmids if p in self._row], dtype=np.int64)
+            return [self.pmids[i] for i in rows[keep[rows]]] if len(rows) else []
+
+    # --- Persistence ---
+
+    def save(self, path: str) -> None:
+        """
+        Writes the store to a compressed .npz file (no pickled objects). The file is written
+        next to path and moved into place, so a crash mid-write leaves the old file intact.
+        """
+        with self._lock:
+            lengths = np.array([len(m) for m in self.mesh], dtype=np.int64)
+            mesh_offsets = np.zeros(len(self.mesh) + 1, dtype=np.int64)
+            mesh_offsets[1:] = np.cumsum(lengths)
+            columns = {
+                "date_first": self.date_first,
+                "date_last": self.date_last,
+                "status": self.status,
+                "journal": self.journal,
+                "fetched_at": self.fetched_at,
+                "mesh_offsets": mesh_offsets,
+                "mesh_ids": np.concatenate(self.mesh) if self.mesh else np.zeros(0, dtype=np.int32),
+            }
+            for name, values in (
+                ("pmids", self.pmids), ("titles", self.titles), ("pubdates", self.pubdates),
+                ("status_vocab", self.status_vocab.values), ("journal_vocab", self.journal_vocab.values),
+            ):
+                columns[f"{name}_offsets"], columns[f"{name}_blob"] = _pack_strings(values)
+            fd, tmp_path = tempfile.mkstemp(
+                prefix=os.path.basename(path) + ".", suffix=".tmp", dir=os.path.dirname(os.path.abspath(path))
+            )
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    np.savez_compressed(f, **columns)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, path)
+            except BaseException:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+                raise
+
+    @classmethod
+    def load(cls, path: str, max_age: Optional[float] = DEFAULT_MAX_AGE) -> "ArticleMetadataStore":
+        store = cls(max_age=max_age)
+        with np.load(path, allow_pickle=False) as data:
+            def strings(name: str) -> List[str]:
+                return _unpack_strings(data[f"{name}_offsets"], data[f"{name}_blob"])
+
+            store.pmids = strings("pmids")
+            store.titles = strings("titles")
+            store.pubdates = strings("pubdates")
+            store.status_vocab = _Vocab(strings("status_vocab"))
+            store.journal_vocab = _Vocab(strings("journal_vocab"))
+            store.date_first = data["date_first"]
+            store.date_last = data["date_last"]
+            store.status = data["status"]
+            store.journal = data["journal"]
+            # Files written before fetch times were stored count as stale
+            store.fetched_at = data["fetched_at"] if "fetched_at" in data else np.zeros(len(store.pmids))
+            offsets, mesh_ids = data["mesh_offsets"], data["mesh_ids"]
+            store.mesh = [mesh_ids[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+        store._row = {pmid: i for i, pmid in enumerate(store.pmids)}
+        return store
+
+
+def open_metadata_store(path: str = "") -> ArticleMetadataStore:
+    """
+    Loads the store at path if it exists, else returns an empty one. An unreadable file is
+    moved aside to "<path>.corrupt" and replaced by an empty store. The row max age comes
+    from METADATA_STORE_MAX_AGE_HOURS (default one week; 0 keeps rows forever).
+    """
+    hours = float(os.getenv("METADATA_STORE_MAX_AGE_HOURS", DEFAULT_MAX_AGE / 3600))
+    max_age = hours * 3600 if hours > 0 else None
+    if path and os.path.exists(path):
+        try:
+            return ArticleMetadataStore.load(path, max_age=max_age)
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile) as e:
+            logger.warning(f"Unreadable metadata store {path} ({type(e).__name__}: {e}); moved to {path}.corrupt")
+            os.replace(path, path + ".corrupt")
+    return ArticleMetadataStore(max_age=max_age)
@@ -0,0 +1,158 @@
+# metrics.py
+import os
+import sys
+import time
+import threading
+import tracemalloc
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# Counters recorded by the src functions while a stage is being tracked
+COUNTERS = ("api_calls", "tokens_in", "tokens_out", "bytes_downloaded", "cache_hits", "coalesced",
+            "throttled")
+
+_current_stats: contextvars.ContextVar = contextvars.ContextVar("stage_stats", default=None)
+# tracemalloc's peak is process-wide: it is only reset while no traced block is running,
+# and blocks that overlap another one are flagged in their memory stats
+_memory_trace_lock = threading.Lock()
+_active_memory_traces: Dict[int, Dict] = {}
+
+
+class StageStats:
+    """
+    Wall time and counters for one pipeline stage.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.wall_time = 0.0
+        self.counters: Dict[str, int] = {c: 0 for c in COUNTERS}
+        # Filled by track(..., trace_memory=True)
+        self.memory: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add(self, **counts: int) -> None:
+        with self._lock:
+            for key, value in counts.items():
+                self.counters[key] = self.counters.get(key, 0) + value
+
+    def to_dict(self) -> Dict:
+        return {"stage": self.name, "wall_time": round(self.wall_time, 6), **self.counters, **self.memory}
+
+
+def record(**counts: int) -> None:
+    """
+    Adds counts (e.g. api_calls=1, bytes_downloaded=1024) to the stage currently being
+    tracked in this context. A no-op outside of track().
+    """
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.add(**counts)
+
+
+def record_usage(response) -> None:
+    """
+    Records one API call plus token usage from an OpenAI response, if it reports any.
+    """
+    usage = getattr(response, "usage", None)
+    tokens_in = getattr(usage, "prompt_tokens", 0)
+    tokens_out = getattr(usage, "completion_tokens", 0)
+    record(
+        api_calls=1,
+        tokens_in=tokens_in if isinstance(tokens_in, int) else 0,
+        tokens_out=tokens_out if isinstance(tokens_out, int) else 0,
+    )
+
+
+def current_stats() -> Optional[StageStats]:
+    return _current_stats.get()
+
+
+def rss_bytes() -> Optional[int]:
+    """
+    Current resident set size of this process, or None where /proc is unavailable.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """
+    Peak resident set size of this process so far (high-water mark, never decreases).
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+@contextmanager
+def track(stats: StageStats, trace_memory: bool = False):
+    """
+    Makes stats the target of record() for the enclosed block and adds its wall time.
+    Worker threads must be started with contextvars.copy_context() to inherit it.
+
+    With trace_memory=True, also records into stats.memory:
+      alloc_bytes       net Python allocations kept after the block (tracemalloc)
+      alloc_peak_bytes  peak Python allocations during the block, relative to its start
+      rss_bytes         process RSS after the block
+      rss_delta_bytes   change in process RSS over the block
+      rss_peak_bytes    process RSS high-water mark after the block
+      overlapped        whether another traced block ran at the same time
+    tracemalloc is started on first use. Traced blocks run concurrently; all figures are
+    process-wide, so for an overlapped block they include the other blocks' allocations
+    (and its peak may be one reached before it started). Allocations made meanwhile by
+    untraced threads are always included. For per-stage figures, trace a single-worker run.
+    """
+    if not trace_memory:
+        with _tracked(stats):
+            yield stats
+        return
+
+    trace = {"overlapped": False}
+    with _memory_trace_lock:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if _active_memory_traces:
+            trace["overlapped"] = True
+            for other in _active_memory_traces.values():
+                other["overlapped"] = True
+        else:
+            tracemalloc.reset_peak()
+        _active_memory_traces[id(trace)] = trace
+        alloc_start = tracemalloc.get_traced_memory()[0]
+    rss_start = rss_bytes()
+    try:
+        with _tracked(stats):
+            yield stats
+    finally:
+        with _memory_trace_lock:
+            current, peak = tracemalloc.get_traced_memory()
+            del _active_memory_traces[id(trace)]
+        rss_end = rss_bytes()
+        stats.memory = {
+            "alloc_bytes": current - alloc_start,
+            "alloc_peak_bytes": peak - alloc_start,
+            "rss_bytes": rss_end,
+            "rss_delta_bytes": None if rss_start is None or rss_end is None else rss_end - rss_start,
+            "rss_peak_bytes": peak_rss_bytes(),
+            "overlapped": trace["overlapped"],
+        }
+
+
+@contextmanager
+def _tracked(stats: StageStats):
+    token = _current_stats.set(stats)
+    start = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        stats.wall_time += time.perf_counter() - start
+        _current_stats.reset(token)
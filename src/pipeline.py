@@ -0,0 +1,304 @@
+# pipeline.py
+"""
+Search-to-summary pipeline built from pluggable steps.
+
+Each step is a callable that reads and updates a shared ``state`` dict. A step can stop
+the run early by setting ``state["halt"]`` to a user-facing message. Every step runs
+inside metrics.track(), so the API calls, tokens, bytes and cache hits recorded by the
+src functions it calls end up in that step's StageStats.
+"""
+import json
+import time
+import uuid
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from src.metrics import StageStats, record, track
+from src import deadline as deadlines
+from src.pubmed_api import get_summaries, filter_medline_summaries
+from src.rag_pipeline import build_index, find_top_k
+from src.summarizer import generate_answer
+from src.keyword_extraction import extract_keywords
+from src.enhanced_search import build_refined_query_with_mesh, do_two_phase_search, get_synonyms_dict_gpt
+
+logger = logging.getLogger(__name__)
+
+Step = Callable[[Dict], None]
+
+DEFAULT_SETTINGS = {
+    "start_date": "",           # PubMed format YYYY/MM/DD, "" for no date filter
+    "end_date": "",
+    "retmax": 5,
+    "most_relevant": False,
+    "filter_medline": False,
+    "use_keyword_extraction": True,
+    "use_synonyms": True,
+    "chat_model": "gpt-4",
+    "chunk_size": 300,
+    "top_k": 3,
+    "mesh_index": None,         # optional src.mesh_index.MeshIndex
+}
+
+
+class PipelineCancelled(Exception):
+    """
+    Raised between stages when a run is cancelled or passes its deadline.
+    """
+
+
+class PipelineResult:
+    """
+    Final state of a pipeline run plus the per-stage trace.
+    """
+
+    def __init__(self, run_id: str, state: Dict, trace: List[StageStats]):
+        self.run_id = run_id
+        self.state = state
+        self.trace = trace
+
+    @property
+    def halted(self) -> Optional[str]:
+        return self.state.get("halt")
+
+    @property
+    def total_time(self) -> float:
+        return sum(s.wall_time for s in self.trace)
+
+    def trace_dicts(self) -> List[Dict]:
+        return [s.to_dict() for s in self.trace]
+
+
+class Pipeline:
+    """
+    Ordered list of named steps run against a shared state dict.
+    """
+
+    def __init__(self, steps: Optional[List[Tuple[str, Step]]] = None):
+        self.steps: List[Tuple[str, Step]] = list(steps or [])
+
+    def add_step(self, name: str, step: Step) -> "Pipeline":
+        self.steps.append((name, step))
+        return self
+
+    def replace_step(self, name: str, step: Step) -> "Pipeline":
+        for i, (existing, _) in enumerate(self.steps):
+            if existing == name:
+                self.steps[i] = (name, step)
+                return self
+        raise KeyError(f"No pipeline step named {name!r}")
+
+    def run(
+        self,
+        state: Dict,
+        trace_path: Optional[str] = None,
+        on_stage: Optional[Callable[[StageStats], None]] = None,
+        cancel_event: Optional[threading.Event] = None,
+        deadline: Optional[float] = None,
+        trace_memory: bool = False
+    ) -> PipelineResult:
+        """
+        Runs the steps in order until they finish or one of them sets state["halt"].
+
+        :param state: Initial state (user query plus settings); updated in place
+        :param trace_path: If given, the trace is appended to this file as JSON lines
+        :param on_stage: Called with each stage's StageStats once the stage finishes
+        :param cancel_event: If set, the run stops before the next stage; NCBI and OpenAI
+            calls made by the steps also stop waiting for a slot or retry
+        :param deadline: time.monotonic() value after which the run stops before the next stage;
+            NCBI and OpenAI requests made by the steps also time out by then
+        :param trace_memory: Record per-stage tracemalloc allocations and RSS (slows the run down)
+        :return: PipelineResult with the final state and per-stage StageStats
+        :raises PipelineCancelled: When cancel_event is set or the deadline has passed
+        """
+        run_id = uuid.uuid4().hex
+        trace = []
+        for name, step in self.steps:
+            if cancel_event is not None and cancel_event.is_set():
+                raise PipelineCancelled(f"Cancelled before stage {name}")
+            if deadline is not None and time.monotonic() > deadline:
+                raise PipelineCancelled(f"Timed out before stage {name}")
+            stats = StageStats(name)
+            try:
+                with track(stats, trace_memory=trace_memory), deadlines.scope(deadline, cancel_event):
+                    step(state)
+            except Exception as e:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise PipelineCancelled(f"Cancelled during stage {name}") from e
+                if deadline is not None and time.monotonic() > deadline:
+                    raise PipelineCancelled(f"Timed out during stage {name}") from e
+                raise
+            trace.append(stats)
+            logger.info(f"Pipeline stage {name}: {stats.to_dict()}")
+            if on_stage is not None:
+                on_stage(stats)
+            if state.get("halt"):
+                break
+
+        result = PipelineResult(run_id, state, trace)
+        if trace_path:
+            write_trace_jsonl(result, trace_path)
+        return result
+
+
+def write_trace_jsonl(result: PipelineResult, path: str) -> None:
+    """
+    Appends one JSON line per stage of a pipeline run.
+    """
+    timestamp = time.time()
+    with open(path, "a", encoding="utf-8") as f:
+        for entry in result.trace_dicts():
+            f.write(json.dumps({"run_id": result.run_id, "timestamp": timestamp, **entry}) + "\n")
+
+
+def new_state(user_query: str, **settings) -> Dict:
+    """
+    Builds the initial state for the search pipeline, filling in DEFAULT_SETTINGS.
+    """
+    unknown = set(settings) - set(DEFAULT_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown pipeline settings: {sorted(unknown)}")
+    return {"user_query": user_query, **DEFAULT_SETTINGS, **settings}
+
+
+# --- Default steps (Steps 1-9 of the app flow) ---
+
+def keywords_step(state: Dict) -> None:
+    if state["use_keyword_extraction"]:
+        state["extracted"] = extract_keywords(state["user_query"], model_name=state["chat_model"])
+    else:
+        state["extracted"] = state["user_query"]
+
+
+def synonyms_step(state: Dict) -> None:
+    state["synonyms_dict"] = {}
+    if state["use_synonyms"]:
+        state["synonyms_dict"] = get_synonyms_dict_gpt(state["extracted"], model_name=state["chat_model"])
+
+
+def query_step(state: Dict) -> None:
+    main_terms = [t.strip() for t in state["extracted"].split(",") if t.strip()]
+    state["query_str"] = build_refined_query_with_mesh(
+        main_terms, state["synonyms_dict"], mesh_index=state["mesh_index"]
+    )
+
+
+def search_step(state: Dict) -> None:
+    state["pmids"] = do_two_phase_search(
+        state["query_str"],
+        state["start_date"],
+        state["end_date"],
+        state["retmax"],
+        state["most_relevant"]
+    )
+    if not state["pmids"]:
+        state["halt"] = "No articles found after applying expansions and related searches."
+
+
+def summaries_step(state: Dict) -> None:
+    summaries = get_summaries(state["pmids"])
+    if state["filter_medline"]:
+        summaries = filter_medline_summaries(summaries)
+    state["summaries"] = summaries
+    if not summaries:
+        state["halt"] = "No articles found after applying MEDLINE filtering."
+
+
+def articles_step(state: Dict) -> None:
+    # Here, using title and pubdate as a placeholder abstract.
+    state["articles"] = [
+        {"pmid": s["pmid"], "abstract": f"{s['title']} - {s['pubdate']}"}
+        for s in state["summaries"]
+    ]
+
+
+def index_step(state: Dict) -> None:
+    state["rag_index"] = build_index(state["articles"], chunk_size=state["chunk_size"])
+
+
+def retrieve_step(state: Dict) -> None:
+    state["top_chunks"] = find_top_k(state["user_query"], state["rag_index"], k=state["top_k"])
+
+
+def answer_step(state: Dict) -> None:
+    context_list = [x["chunk_text"] for x in state["top_chunks"]]
+    state["answer"] = generate_answer(context_list, state["user_query"], model_name=state["chat_model"])
+
+
+DEFAULT_STEPS: List[Tuple[str, Step]] = [
+    ("extract_keywords", keywords_step),
+    ("synonyms", synonyms_step),
+    ("build_query", query_step),
+    ("search", search_step),
+    ("summaries", summaries_step),
+    ("prepare_articles", articles_step),
+    ("build_index", index_step),
+    ("retrieve", retrieve_step),
+    ("answer", answer_step),
+]
+
+
+# --- Follow-up questions against an already built index ---
+
+def cached_index_step(state: Dict) -> None:
+    # The index comes from an earlier run kept by the caller (e.g. Streamlit session state)
+    if state.get("rag_index"):
+        record(cache_hits=1)
+    else:
+        state["halt"] = "No indexed articles to answer from; run a search first."
+
+
+FOLLOWUP_STEPS: List[Tuple[str, Step]] = [
+    ("cached_index", cached_index_step),
+    ("retrieve", retrieve_step),
+    ("answer", answer_step),
+]
+
+
+def followup_state(state: Dict, question: str) -> Dict:
+    """
+    Copies a finished search state for a new question, keeping the PMIDs, summaries and
+    RAG index so that answering costs one query embedding and one chat call.
+    """
+    followup = {k: v for k, v in state.items() if k not in ("halt", "top_chunks", "answer")}
+    followup["user_query"] = question
+    return followup
+
+
+def build_followup_pipeline() -> Pipeline:
+    """
+    Returns a Pipeline that only retrieves and answers against state["rag_index"].
+    """
+    return Pipeline(FOLLOWUP_STEPS)
+
+
+def build_search_pipeline() -> Pipeline:
+    """
+    Returns a Pipeline with the default search-to-summary steps.
+    """
+    return Pipeline(DEFAULT_STEPS)
+
+
+def run_search(user_query: str, trace_path: Optional[str] = None, **settings) -> PipelineResult:
+    """
+    Convenience wrapper: runs the default pipeline for a single query.
+    """
+    return build_search_pipeline().run(new_state(user_query, **settings), trace_path=trace_path)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the PubMed search-to-summary pipeline")
+    parser.add_argument("query", help="Research question or topic")
+    parser.add_argument("--retmax", type=int, default=5)
+    parser.add_argument("--trace", default=None, help="Append the stage trace to this JSONL file")
+    parser.add_argument("--memory", action="store_true", help="Record per-stage memory usage")
+    args = parser.parse_args()
+
+    result = build_search_pipeline().run(
+        new_state(args.query, retmax=args.retmax), trace_path=args.trace, trace_memory=args.memory
+    )
+    print(result.halted or result.state["answer"])
+    for entry in result.trace_dicts():
+        print(json.dumps(entry))
@@ -1,20 +1,76 @@
+import os
 import requests
 import logging
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 import xml.etree.ElementTree as ET
+from src import deadline
+from src.metrics import record
+from src.singleflight import coalesce
+from src.metadata_store import ArticleMetadataStore, MEDLINE_STATUSES
 
 logger = logging.getLogger(__name__)
 
+# Overridable so the benchmarks (and tests) can point at a local stand-in for NCBI
+EUTILS_BASE_URL = os.getenv("NCBI_EUTILS_URL", "https://eutils.ncbi.nlm.nih.gov/entrez/eutils")
+
+# Optional shared requests.Session (connection pooling); plain requests.get when unset
+_session = None
+
+def set_session(session) -> None:
+    """
+    Routes all E-utilities calls through the given requests.Session (or back to
+    plain requests.get with None), so long-lived processes reuse pooled connections.
+    """
+    global _session
+    _session = session
+
+# (connect, read) timeout in seconds for every E-utilities request
+HTTP_TIMEOUT = (
+    float(os.getenv("NCBI_CONNECT_TIMEOUT", "5")),
+    float(os.getenv("NCBI_READ_TIMEOUT", "30")),
+)
+
+def http_timeout() -> Tuple[float, float]:
+    """
+    HTTP_TIMEOUT, shortened to the time left before the current deadline (see src.deadline).
+
+    :raises DeadlineExceeded: When the deadline has already passed
+    """
+    deadline.check()
+    left = deadline.time_left()
+    if left is None:
+        return HTTP_TIMEOUT
+    return min(HTTP_TIMEOUT[0], left), min(HTTP_TIMEOUT[1], left)
+
+def http_get(url: str, params: Dict):
+    return (_session or requests).get(url, params=params, timeout=http_timeout())
+
+# Optional local metadata store filled by every fetch path; get_summaries serves known PMIDs from it
+_metadata_store: Optional[ArticleMetadataStore] = None
+
+def set_metadata_store(store: Optional[ArticleMetadataStore]) -> None:
+    """
+    Attaches (or with None, detaches) the process-wide article metadata store.
+    """
+    global _metadata_store
+    _metadata_store = store
+
+def get_metadata_store() -> Optional[ArticleMetadataStore]:
+    return _metadata_store
+
+@coalesce("efetch_mesh", normalize=("keyword",))
 def fetch_mesh_terms(keyword: str, retmax: int = 5) -> List[str]:
     """
     Fetches MeSH terms for a given keyword using PubMed's E-Utilities API.
+    Costs two network round trips per keyword; prefer src.mesh_index.MeshIndex.mesh_headings
+    when a local MeSH index is available.
     
     :param keyword: The search keyword.
     :param retmax: The maximum number of PMIDs to retrieve for fetching MeSH terms.
     :return: A list of unique MeSH terms.
     """
     # Step 1: ESearch to get PMIDs
-    esearch_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
+    esearch_url = f"{EUTILS_BASE_URL}/esearch.fcgi"
     esearch_params = {
         "db": "pubmed",
         "term": keyword,
@@ -22,7 +78,8 @@ def fetch_mesh_terms(keyword: str, retmax: int = 5) -> List[str]:
         "retmode": "xml"
     }
     
-    esearch_resp = requests.get(esearch_url, params=esearch_params)
+    esearch_resp = http_get(esearch_url, params=esearch_params)
+    record(api_calls=1, bytes_downloaded=len(esearch_resp.content))
     if esearch_resp.status_code != 200:
         print(f"ESearch API request failed with status code {esearch_resp.status_code}")
         return []
@@ -34,19 +91,31 @@ def fetch_mesh_terms(keyword: str, retmax: int = 5) -> List[str]:
         return []
     
     # Step 2: EFetch to get MeSH terms
-    efetch_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
+    efetch_url = f"{EUTILS_BASE_URL}/efetch.fcgi"
     efetch_params = {
         "db": "pubmed",
         "id": ",".join(pmids),
         "retmode": "xml"
     }
     
-    efetch_resp = requests.get(efetch_url, params=efetch_params)
+    efetch_resp = http_get(efetch_url, params=efetch_params)
+    record(api_calls=1, bytes_downloaded=len(efetch_resp.content))
     if efetch_resp.status_code != 200:
         print(f"EFetch API request failed with status code {efetch_resp.status_code}")
         return []
+    if _metadata_store is not None:
+        _metadata_store.add_efetch_xml(efetch_resp.content)
     
-    efetch_root = ET.fromstring(efetch_resp.content)
+    return parse_mesh_headings(efetch_resp.content)
+
+def parse_mesh_headings(efetch_xml) -> List[str]:
+    """
+    Extracts the unique MeSH descriptor names from an EFetch PubmedArticleSet XML payload.
+
+    :param efetch_xml: EFetch response body (bytes or str)
+    :return: A list of unique MeSH terms.
+    """
+    efetch_root = ET.fromstring(efetch_xml)
     mesh_terms = set()
     
     for article in efetch_root.findall(".//PubmedArticle"):
@@ -57,6 +126,7 @@ def fetch_mesh_terms(keyword: str, retmax: int = 5) -> List[str]:
     
     return list(mesh_terms)
 
+@coalesce("esearch", normalize=("query",))
 def search_pubmed(
     query: str,
     start_date: str,
@@ -77,7 +147,7 @@ def search_pubmed(
     :return: List of PMIDs (list of strings)
     """
     # Build the base ESearch URL
-    base_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
+    base_url = f"{EUTILS_BASE_URL}/esearch.fcgi"
 
     # Construct a date filter; dp = Date of Publication in PubMed
     # Example: (query) AND (2023/01/01 : 2023/12/31[dp])
@@ -102,7 +172,8 @@ def search_pubmed(
     logger.info(f"PubMed ESearch params: {params}")
 
     # Send GET request to PubMed
-    response = requests.get(base_url, params=params)
+    response = http_get(base_url, params=params)
+    record(api_calls=1, bytes_downloaded=len(response.content))
     response.raise_for_status()
     data = response.json()
 
@@ -113,6 +184,7 @@ def search_pubmed(
     return pmid_list
 
 
+@coalesce("esummary")
 def get_summaries(pmids: List[str]) -> List[Dict]:
     """
     Получает краткие метаданные статей (title, journal, pubdate и т.д.) через ESummary.
@@ -122,15 +194,27 @@ def get_summaries(pmids: List[str]) -> List[Dict]:
     """
     if not pmids:
         return []
+    if _metadata_store is None:
+        return _fetch_summaries(pmids)
 
-    base_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esummary.fcgi"
+    # Only download PMIDs the local store has not seen yet
+    missing = _metadata_store.missing(pmids)
+    record(cache_hits=len(pmids) - len(missing))
+    if missing:
+        _metadata_store.add_summaries(_fetch_summaries(missing))
+    return _metadata_store.get_summaries(pmids)
+
+
+def _fetch_summaries(pmids: List[str]) -> List[Dict]:
+    base_url = f"{EUTILS_BASE_URL}/esummary.fcgi"
     params = {
         "db": "pubmed",
         "id": ",".join(pmids),
         "retmode": "json"
     }
 
-    response = requests.get(base_url, params=params)
+    response = http_get(base_url, params=params)
+    record(api_calls=1, bytes_downloaded=len(response.content))
     response.raise_for_status()
     data = response.json()
 
@@ -166,6 +250,12 @@ def filter_medline_summaries(summaries: List[Dict]) -> List[Dict]:
     :param summaries: Список словарей с метаданными статей
     :return: Отфильтрованный список
     """
+    pmids = [item["pmid"] for item in summaries]
+    if _metadata_store is not None and not _metadata_store.missing(pmids):
+        # Vectorized over the store's status column
+        keep = set(_metadata_store.filter(pmids, statuses=MEDLINE_STATUSES))
+        return [item for item in summaries if item["pmid"] in keep]
+
     filtered = []
     for item in summaries:
         # Lowercase for robust comparison
@@ -175,6 +265,7 @@ def filter_medline_summaries(summaries: List[Dict]) -> List[Dict]:
     return filtered
 
 
+@coalesce("efetch")
 def fetch_abstracts(pmids: List[str]) -> str:
     """
     Использует EFetch для получения XML, содержащего полный абстракт статьи.
@@ -185,15 +276,18 @@ def fetch_abstracts(pmids: List[str]) -> str:
     if not pmids:
         return ""
 
-    base_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
+    base_url = f"{EUTILS_BASE_URL}/efetch.fcgi"
     params = {
         "db": "pubmed",
         "id": ",".join(pmids),
         "retmode": "xml"
     }
 
-    response = requests.get(base_url, params=params)
+    response = http_get(base_url, params=params)
+    record(api_calls=1, bytes_downloaded=len(response.content))
     response.raise_for_status()
+    if _metadata_store is not None:
+        _metadata_store.add_efetch_xml(response.content)
     return response.text
 
 
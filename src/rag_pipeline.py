@@ -1,6 +1,8 @@
 # rag_pipeline.py
-from typing import List, Dict
+import heapq
+from typing import List, Dict, Iterable, Iterator
 from .embeddings import create_embeddings
+from .rate_limiter import INTERACTIVE
 import numpy as np
 
 def chunk_text(text: str, chunk_size: int = 500) -> List[str]:
@@ -22,27 +24,89 @@ def chunk_text(text: str, chunk_size: int = 500) -> List[str]:
     return chunks
 
 def build_index(abstracts: List[Dict], chunk_size: int = 500) -> List[Dict]:
-    index = []
+    # 1) split every text into chunks, remembering which PMID each chunk came from
+    pmids = []
+    chunks = []
     for item in abstracts:
-        pmid = item["pmid"]
-        text = item.get("abstract", "")
-        # 1) split text into chunks
-        chunks = chunk_text(text, chunk_size=chunk_size)
-        # 2) create embeddings in batch
-        # create_embeddings returns e.g. [(chunk_str, emb_vec), (chunk_str, emb_vec), ...]
-        chunk_and_embs = create_embeddings(chunks)  
-        for (chunk_text_str, emb_vec) in chunk_and_embs:
-            # each emb_vec is a 1D list of floats
-            index.append({
-                "pmid": pmid,
-                "chunk_text": chunk_text_str,
-                "embedding": emb_vec
-            })
+        for chunk in chunk_text(item.get("abstract", ""), chunk_size=chunk_size):
+            pmids.append(item["pmid"])
+            chunks.append(chunk)
+    # 2) create embeddings for all chunks at once (create_embeddings batches the requests)
+    # create_embeddings returns e.g. [(chunk_str, emb_vec), (chunk_str, emb_vec), ...]
+    chunk_and_embs = create_embeddings(chunks)
+    index = []
+    for pmid, (chunk_text_str, emb_vec) in zip(pmids, chunk_and_embs):
+        # each emb_vec is a 1D list of floats
+        index.append({
+            "pmid": pmid,
+            "chunk_text": chunk_text_str,
+            "embedding": emb_vec
+        })
     return index
 
+def _embed_segment(pmids: List[str], chunks: List[str]) -> List[Dict]:
+    chunk_and_embs = create_embeddings(chunks)
+    # float32 arrays take ~8x less memory than lists of Python floats
+    return [
+        {"pmid": pmid, "chunk_text": chunk_text_str, "embedding": np.asarray(emb_vec, dtype=np.float32)}
+        for pmid, (chunk_text_str, emb_vec) in zip(pmids, chunk_and_embs)
+    ]
+
+def build_index_streaming(
+    abstracts: Iterable[Dict],
+    chunk_size: int = 500,
+    segment_size: int = 256
+) -> Iterator[List[Dict]]:
+    """
+    Streaming variant of build_index: consumes articles lazily and yields index segments of
+    at most segment_size chunks, so peak memory is bounded by one segment rather than the corpus.
+
+    :param abstracts: Iterable (e.g. a generator) of {"pmid", "abstract"} dicts
+    :param chunk_size: Size of each chunk (in characters)
+    :param segment_size: Number of chunks embedded and yielded together
+    :return: Iterator of segments; entries look like build_index's, with float32 array embeddings
+    """
+    pmids = []
+    chunks = []
+    for item in abstracts:
+        for chunk in chunk_text(item.get("abstract", ""), chunk_size=chunk_size):
+            pmids.append(item["pmid"])
+            chunks.append(chunk)
+            if len(chunks) == segment_size:
+                yield _embed_segment(pmids, chunks)
+                pmids, chunks = [], []
+    if chunks:
+        yield _embed_segment(pmids, chunks)
+
+def find_top_k_streaming(query: str, segments: Iterable[List[Dict]], k: int = 3) -> List[Dict]:
+    """
+    find_top_k over index segments (e.g. from build_index_streaming or loaded one at a time),
+    keeping only the current best k chunks in memory.
+    """
+    q_pairs = create_embeddings([query], priority=INTERACTIVE)
+    query_vec = np.asarray(q_pairs[0][1], dtype=np.float32)
+    query_norm = np.linalg.norm(query_vec)
+
+    best = []  # min-heap of (score, -position, item); earlier chunks win ties, as in find_top_k
+    position = 0
+    for segment in segments:
+        if not segment:
+            continue
+        matrix = np.stack([np.asarray(item["embedding"], dtype=np.float32) for item in segment])
+        norms = np.linalg.norm(matrix, axis=1) * query_norm
+        scores = np.divide(matrix @ query_vec, norms, out=np.zeros(len(segment), dtype=np.float32), where=norms != 0)
+        for item, score in zip(segment, scores.tolist()):
+            entry = (score, -position, item)
+            position += 1
+            if len(best) < k:
+                heapq.heappush(best, entry)
+            elif entry[:2] > best[0][:2]:
+                heapq.heapreplace(best, entry)
+    return [item for _, _, item in sorted(best, key=lambda e: e[:2], reverse=True)]
+
 def find_top_k(query: str, index: List[Dict], k: int = 3) -> List[Dict]:
     # query_vec = create_embeddings(...) -> returns e.g. [(q_str, vec)]
-    q_pairs = create_embeddings([query])
+    q_pairs = create_embeddings([query], priority=INTERACTIVE)
     query_vec = q_pairs[0][1]  # single embedding vector
 
     scored = []
@@ -0,0 +1,350 @@
+# rate_limiter.py
+"""
+Shared, rate-limit-aware scheduler for OpenAI calls.
+
+Every OpenAI request in src goes through get_scheduler().call(). The scheduler keeps
+request and token buckets sized from the x-ratelimit-* response headers, admits queued
+calls in priority order (interactive answers before background embeddings), and adapts
+its concurrency: additive increase on success, halving plus a pause on HTTP 429. OpenAI
+limits are per model, so all of this state is kept per model.
+"""
+import os
+import re
+import json
+import time
+import heapq
+import random
+import logging
+import itertools
+import threading
+from typing import Any, Callable, Dict, List, Mapping, Optional, Union
+
+import openai
+
+from src import deadline
+from src.metrics import record
+
+logger = logging.getLogger(__name__)
+
+# Priorities: lower runs first
+INTERACTIVE = 0
+NORMAL = 1
+BACKGROUND = 2
+
+# Completion tokens assumed for chat calls without max_tokens
+DEFAULT_COMPLETION_TOKENS = 500
+
+# Budget key for calls that do not name their model
+DEFAULT_MODEL = "default"
+
+# Failures retried with backoff (APITimeoutError is an APIConnectionError)
+TRANSIENT_ERRORS = (openai.APIConnectionError, openai.InternalServerError)
+MAX_BACKOFF = 8.0
+
+# Longest wait between checks of the current deadline/cancellation while queued
+WAIT_POLL = 0.25
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+def parse_reset(value: str) -> Optional[float]:
+    """
+    Parses OpenAI reset durations such as "20ms", "1s", "6m0s" or "1h2m3.5s" into seconds.
+    """
+    if not value:
+        return None
+    parts = _DURATION_PART.findall(value.strip())
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    scale = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+    return sum(float(number) * scale[unit] for number, unit in parts)
+
+
+def estimate_tokens(content: Union[str, List[str], List[Dict]], completion_tokens: int = 0) -> int:
+    """
+    Rough token count for a request: ~4 characters per token plus per-message overhead.
+
+    :param content: Prompt string, list of strings (embeddings input) or chat messages
+    :param completion_tokens: Tokens expected in the answer (max_tokens for chat calls)
+    """
+    if isinstance(content, str):
+        content = [content]
+    total = 0
+    for item in content:
+        text = item.get("content", "") if isinstance(item, dict) else item
+        total += len(str(text)) // 4 + 4
+    return total + completion_tokens
+
+
+class _Bucket:
+    """
+    Token bucket refilled continuously at capacity per minute.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60.0)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        missing = amount - self.level
+        return 0.0 if missing <= 0 else missing * 60.0 / self.capacity
+
+
+class _ModelState:
+    """
+    Budgets, adaptive concurrency and admission queue of one model (OpenAI limits are per model).
+    """
+
+    def __init__(self, rpm: float, tpm: float, concurrency: float):
+        self.requests = _Bucket(rpm)
+        self.tokens = _Bucket(tpm)
+        self.concurrency = concurrency
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.waiting: List = []
+
+
+class OpenAIScheduler:
+    """
+    Admits OpenAI calls within request/token budgets, in priority order, with adaptive concurrency.
+    Budgets, concurrency and 429 pauses are kept per model.
+
+    :param rpm: Initial requests-per-minute limit per model (replaced by x-ratelimit-limit-requests)
+    :param tpm: Initial tokens-per-minute limit per model (replaced by x-ratelimit-limit-tokens)
+    :param max_concurrency: Upper bound on calls in flight per model
+    :param initial_concurrency: Calls in flight allowed per model before any feedback
+    :param max_retries: Retries of a call that failed with HTTP 429, a connection error,
+        a timeout or a 5xx response (the OpenAI clients themselves do not retry)
+    :param backoff: Initial delay before retrying a connection error or 5xx; doubles per attempt
+    """
+
+    def __init__(
+        self,
+        rpm: int = 500,
+        tpm: int = 200_000,
+        max_concurrency: int = 32,
+        initial_concurrency: int = 4,
+        max_retries: int = 5,
+        backoff: float = 0.5
+    ):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrency = max_concurrency
+        self.initial_concurrency = float(min(initial_concurrency, max_concurrency))
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.throttled = 0
+        self._models: Dict[str, _ModelState] = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def model_state(self, model: str) -> _ModelState:
+        """
+        State of the given model, created with the initial limits on first use.
+        """
+        with self._cond:
+            state = self._models.get(model)
+            if state is None:
+                state = self._models[model] = _ModelState(self.rpm, self.tpm, self.initial_concurrency)
+            return state
+
+    # --- Feedback from responses ---
+
+    def observe_headers(self, headers: Mapping[str, str], model: str = DEFAULT_MODEL) -> None:
+        """
+        Updates the model's budgets from x-ratelimit-* headers of one of its responses.
+        """
+        state = self.model_state(model)
+        with self._cond:
+            now = time.monotonic()
+            for bucket, kind in ((state.requests, "requests"), (state.tokens, "tokens")):
+                limit = headers.get(f"x-ratelimit-limit-{kind}")
+                remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+                bucket.refill(now)
+                if limit and limit.isdigit() and int(limit) > 0:
+                    bucket.capacity = float(limit)
+                    bucket.level = min(bucket.level, bucket.capacity)
+                if remaining and remaining.isdigit():
+                    # Other processes share the same key; trust the server's view when it is lower
+                    bucket.level = min(bucket.level, float(remaining))
+            self._cond.notify_all()
+
+    def httpx_response_hook(self, response) -> None:
+        """
+        httpx event hook: feeds every OpenAI HTTP response's headers into the scheduler,
+        under the model named in the request body.
+        """
+        try:
+            model = json.loads(response.request.content or b"{}").get("model")
+        except (ValueError, AttributeError):
+            model = None
+        if model:
+            self.observe_headers(response.headers, model)
+
+    # --- Admission ---
+
+    def _admissible(self, state: _ModelState, entry, est_tokens: float, now: float) -> float:
+        """
+        Returns 0 if the call at the head of the model's queue may start now, else seconds to wait.
+        """
+        if state.waiting[0] is not entry or state.in_flight >= int(state.concurrency):
+            return 1.0
+        if now < state.paused_until:
+            return state.paused_until - now
+        state.requests.refill(now)
+        state.tokens.refill(now)
+        return max(state.requests.wait_time(1), state.tokens.wait_time(min(est_tokens, state.tokens.capacity)))
+
+    def _acquire(self, state: _ModelState, priority: int, est_tokens: float) -> None:
+        """
+        Waits for a slot; gives up when the current deadline passes or the run is cancelled
+        (checked at least every WAIT_POLL seconds).
+        """
+        entry = [priority, next(self._seq)]
+        with self._cond:
+            heapq.heappush(state.waiting, entry)
+            try:
+                while True:
+                    deadline.check()
+                    wait = self._admissible(state, entry, est_tokens, time.monotonic())
+                    if wait <= 0:
+                        break
+                    left = deadline.time_left()
+                    self._cond.wait(timeout=min(wait, WAIT_POLL, left if left is not None else WAIT_POLL))
+            except BaseException:
+                state.waiting.remove(entry)
+                heapq.heapify(state.waiting)
+                self._cond.notify_all()
+                raise
+            heapq.heappop(state.waiting)
+            state.in_flight += 1
+            state.requests.level -= 1
+            state.tokens.level -= min(est_tokens, state.tokens.capacity)
+            self._cond.notify_all()
+
+    def _release(self, state: _ModelState, succeeded: bool = True, throttled: bool = False,
+                 retry_after: float = 0.0, token_correction: float = 0.0) -> None:
+        with self._cond:
+            state.in_flight -= 1
+            state.tokens.level -= token_correction
+            if throttled:
+                self.throttled += 1
+                state.concurrency = max(1.0, state.concurrency / 2)
+                state.paused_until = max(state.paused_until, time.monotonic() + retry_after)
+            elif succeeded:
+                state.concurrency = min(float(self.max_concurrency), state.concurrency + 1.0 / state.concurrency)
+            self._cond.notify_all()
+
+    @staticmethod
+    def _retry_after(error: "openai.RateLimitError") -> float:
+        headers = getattr(getattr(error, "response", None), "headers", {}) or {}
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        for name in ("retry-after", "x-ratelimit-reset-requests", "x-ratelimit-reset-tokens"):
+            seconds = parse_reset(headers.get(name, ""))
+            if seconds:
+                return seconds
+        return 1.0
+
+    def call(self, fn: Callable[[], Any], priority: int = NORMAL, est_tokens: int = 0,
+             model: str = DEFAULT_MODEL) -> Any:
+        """
+        Runs fn() once the model's budgets allow it, retrying on HTTP 429 (after the server's
+        retry-after) and on connection errors, timeouts and 5xx responses (exponential backoff).
+
+        :param fn: Zero-argument callable making one OpenAI request
+        :param priority: INTERACTIVE, NORMAL or BACKGROUND
+        :param est_tokens: Estimated tokens for the request (see estimate_tokens)
+        :param model: Model the request uses; budgets and 429 pauses are kept per model
+        :return: fn()'s return value
+        """
+        state = self.model_state(model)
+        for attempt in range(self.max_retries + 1):
+            self._acquire(state, priority, est_tokens)
+            try:
+                response = fn()
+            except openai.RateLimitError as e:
+                retry_after = self._retry_after(e)
+                self._release(state, throttled=True, retry_after=retry_after)
+                record(throttled=1)
+                if attempt == self.max_retries:
+                    raise
+                logger.warning(f"OpenAI rate limit hit for {model}; retrying in {retry_after:.2f}s")
+                continue
+            except TRANSIENT_ERRORS as e:
+                self._release(state, succeeded=False)
+                if attempt == self.max_retries:
+                    raise
+                # Same schedule as the SDK's own retries: doubling, capped, with jitter
+                delay = min(self.backoff * 2 ** attempt, MAX_BACKOFF) * (1 - 0.25 * random.random())
+                logger.warning(f"OpenAI call to {model} failed ({type(e).__name__}); retrying in {delay:.2f}s")
+                deadline.sleep(delay)
+                continue
+            except BaseException:
+                self._release(state, succeeded=False)
+                raise
+            usage = getattr(getattr(response, "usage", None), "total_tokens", None)
+            correction = usage - est_tokens if isinstance(usage, int) else 0
+            self._release(state, token_correction=correction)
+            return response
+
+
+_scheduler: Optional[OpenAIScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> OpenAIScheduler:
+    """
+    Process-wide scheduler, configured from OPENAI_RPM, OPENAI_TPM and OPENAI_MAX_CONCURRENCY
+    (initial limits applied to each model until its response headers are seen).
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = OpenAIScheduler(
+                rpm=int(os.getenv("OPENAI_RPM", "500")),
+                tpm=int(os.getenv("OPENAI_TPM", "200000")),
+                max_concurrency=int(os.getenv("OPENAI_MAX_CONCURRENCY", "32")),
+            )
+        return _scheduler
+
+
+def request_timeout() -> Union[float, "openai.NotGiven"]:
+    """
+    Per-request timeout for OpenAI calls: the time left before the current deadline
+    (see src.deadline), or the client default without one.
+
+    :raises DeadlineExceeded: When the deadline has already passed
+    """
+    deadline.check()
+    left = deadline.time_left()
+    return openai.NOT_GIVEN if left is None else left
+
+
+def _response_hook(response) -> None:
+    get_scheduler().httpx_response_hook(response)
+
+
+def scheduled_http_client(**kwargs) -> "openai.DefaultHttpxClient":
+    """
+    httpx client (with the OpenAI defaults) that reports rate-limit headers to the scheduler.
+    """
+    return openai.DefaultHttpxClient(event_hooks={"response": [_response_hook]}, **kwargs)
+
+
+def scheduled_client(http_client=None, **kwargs) -> "openai.OpenAI":
+    """
+    OpenAI client for use with the scheduler: header hooks installed, SDK retries disabled.
+    The scheduler owns retries; SDK retries would resend 429s without halving concurrency
+    or charging the buckets.
+    """
+    return openai.OpenAI(http_client=http_client or scheduled_http_client(), max_retries=0, **kwargs)
+
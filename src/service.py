@@ -0,0 +1,440 @@
+# service.py
+"""
+Headless HTTP service around the search pipeline.
+
+Jobs run on a bounded worker pool; clients submit a query, get a job id back, and then
+poll, stream progress or fetch the result:
+
+    POST   /jobs               {"query": "...", "settings": {...}}  -> 202 {"job_id": ...}
+    GET    /jobs/<id>          status and finished stages
+    GET    /jobs/<id>/events   progress as server-sent events until the job finishes
+    GET    /jobs/<id>/result   final answer, references and trace
+    DELETE /jobs/<id>          cancel a queued or running job
+    GET    /health             worker and queue counts
+
+Run with: python -m src.service --port 8080 --workers 4
+"""
+import re
+import json
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+
+from src.metrics import StageStats
+from src.singleflight import coalesced_counts
+from src.pipeline import DEFAULT_SETTINGS, Pipeline, PipelineCancelled, build_search_pipeline, new_state
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TIMED_OUT = "timed_out"
+FINISHED_STATUSES = (SUCCEEDED, FAILED, CANCELLED, TIMED_OUT)
+
+# Settings a client may pass; everything else (e.g. mesh_index) is configured server-side
+CLIENT_SETTINGS = tuple(k for k in DEFAULT_SETTINGS if k != "mesh_index")
+
+_DATE = re.compile(r"\d{4}/\d{2}/\d{2}")
+
+
+class QueueFull(Exception):
+    """
+    Raised when a job is submitted while the queue is at its depth limit.
+    """
+
+
+def validate_settings(settings) -> Dict:
+    """
+    Checks client settings against the names and value types of DEFAULT_SETTINGS.
+
+    :param settings: Dict of settings, or None for the defaults
+    :return: A copy of settings
+    :raises ValueError: On a non-dict, unknown names, wrong value types, non-positive
+        counts or dates not in YYYY/MM/DD format
+    """
+    if settings is None:
+        return {}
+    if not isinstance(settings, dict):
+        raise ValueError("settings must be a JSON object")
+    unknown = set(settings) - set(CLIENT_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown settings: {sorted(unknown)}")
+    for name, value in settings.items():
+        expected = type(DEFAULT_SETTINGS[name])
+        # type() rather than isinstance(): True must not pass as an int
+        if type(value) is not expected:
+            raise ValueError(f"Setting {name!r} must be {expected.__name__}, got {type(value).__name__}")
+        if expected is int and value < 1:
+            raise ValueError(f"Setting {name!r} must be positive")
+        if name in ("start_date", "end_date") and value and not _DATE.fullmatch(value):
+            raise ValueError(f"Setting {name!r} must be a YYYY/MM/DD date")
+    return dict(settings)
+
+
+class Job:
+    """
+    One pipeline run with its status and progress events.
+    """
+
+    def __init__(self, query: str, settings: Dict):
+        self.id = uuid.uuid4().hex
+        self.query = query
+        self.settings = settings
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.events: List[Dict] = []
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.cancel_event = threading.Event()
+        self.changed = threading.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def add_event(self, event: Dict) -> None:
+        with self.changed:
+            self.events.append(event)
+            self.changed.notify_all()
+
+    def set_status(self, status: str, error: Optional[str] = None) -> None:
+        with self.changed:
+            self.status = status
+            self.error = error
+            if status == RUNNING:
+                self.started_at = time.time()
+            elif status in FINISHED_STATUSES:
+                self.finished_at = time.time()
+            self.events.append({"event": "status", "status": status, "error": error})
+            self.changed.notify_all()
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "query": self.query,
+            "status": self.status,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "stages": [e["stage"] for e in self.events if e.get("event") == "stage"],
+        }
+
+
+def result_to_dict(state: Dict, trace: List[Dict]) -> Dict:
+    """
+    JSON-safe view of a finished pipeline state (no embeddings or index handles).
+    """
+    return {
+        "halt": state.get("halt"),
+        "extracted": state.get("extracted"),
+        "query_str": state.get("query_str"),
+        "pmids": state.get("pmids", []),
+        "summaries": state.get("summaries", []),
+        "answer": state.get("answer"),
+        "references": [
+            {"pmid": c["pmid"], "chunk_text": c["chunk_text"]} for c in state.get("top_chunks", [])
+        ],
+        "trace": trace,
+    }
+
+
+class JobManager:
+    """
+    Runs pipeline jobs on a bounded worker pool.
+
+    :param workers: Number of pipeline runs executing at once
+    :param max_queue: Maximum number of jobs waiting for a worker; more are rejected with QueueFull
+    :param job_timeout: Seconds a job may run before it is stopped at the next stage boundary
+    :param max_jobs_kept: Finished jobs beyond this count are forgotten, oldest first
+    :param pipeline_factory: Builds the Pipeline for each job
+    :param mesh_index: Optional shared MeshIndex passed to every job
+    :param trace_memory: Record per-stage memory usage in each job's trace, for sizing workers.
+        Traced stages of concurrent jobs run one at a time (see metrics.track)
+    """
+
+    def __init__(
+        self,
+        workers: int = 4,
+        max_queue: int = 32,
+        job_timeout: float = 120.0,
+        max_jobs_kept: int = 1000,
+        pipeline_factory: Callable[[], Pipeline] = build_search_pipeline,
+        mesh_index=None,
+        trace_memory: bool = False
+    ):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.job_timeout = job_timeout
+        self.max_jobs_kept = max_jobs_kept
+        self.pipeline_factory = pipeline_factory
+        self.mesh_index = mesh_index
+        self.trace_memory = trace_memory
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pipeline")
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return {
+            "workers": self.workers,
+            "queued": sum(j.status == QUEUED for j in jobs),
+            "running": sum(j.status == RUNNING for j in jobs),
+            "max_queue": self.max_queue,
+            "coalesced": coalesced_counts(),
+        }
+
+    def submit(self, query: str, settings: Optional[Dict] = None) -> Job:
+        """
+        Queues a pipeline run.
+
+        :raises ValueError: On an empty query or unknown or mistyped settings
+        :raises QueueFull: When max_queue jobs are already waiting
+        """
+        if not isinstance(query, str) or not query.strip():
+            raise ValueError("query must be a non-empty string")
+        settings = validate_settings(settings)
+
+        job = Job(query, settings)
+        with self._lock:
+            if sum(j.status == QUEUED for j in self._jobs.values()) >= self.max_queue:
+                raise QueueFull(f"Queue is full ({self.max_queue} jobs waiting)")
+            self._jobs[job.id] = job
+            self._evict_finished()
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """
+        Cancels a job: a queued job never starts, a running one stops at its next stage boundary.
+        """
+        job = self.get(job_id)
+        if job is not None:
+            with job.changed:
+                if job.finished:
+                    return job
+                job.cancel_event.set()
+                if job.status == QUEUED:
+                    job.set_status(CANCELLED)
+        return job
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            job.cancel_event.set()
+        self._executor.shutdown(wait=wait)
+
+    def _evict_finished(self) -> None:
+        excess = len(self._jobs) - self.max_jobs_kept
+        if excess <= 0:
+            return
+        for job_id in [j.id for j in self._jobs.values() if j.finished][:excess]:
+            del self._jobs[job_id]
+
+    def _run(self, job: Job) -> None:
+        # Checked and set under the job's lock so a concurrent cancel() cannot be overwritten
+        with job.changed:
+            if job.status != QUEUED or job.cancel_event.is_set():
+                return
+            job.set_status(RUNNING)
+        state = new_state(job.query, **job.settings)
+        state["mesh_index"] = self.mesh_index
+
+        def on_stage(stats: StageStats) -> None:
+            job.add_event({"event": "stage", **stats.to_dict()})
+
+        try:
+            result = self.pipeline_factory().run(
+                state,
+                on_stage=on_stage,
+                cancel_event=job.cancel_event,
+                deadline=time.monotonic() + self.job_timeout,
+                trace_memory=self.trace_memory,
+            )
+        except PipelineCancelled as e:
+            job.set_status(CANCELLED if job.cancel_event.is_set() else TIMED_OUT, error=str(e))
+        except Exception as e:
+            logger.exception(f"Job {job.id} failed")
+            job.set_status(FAILED, error=f"{type(e).__name__}: {e}")
+        else:
+            job.result = result_to_dict(result.state, result.trace_dicts())
+            job.set_status(SUCCEEDED)
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """
+    JSON API over a JobManager (set as the `manager` class attribute by make_server).
+    """
+    manager: JobManager = None
+
+    def log_message(self, format, *args) -> None:
+        logger.debug(format % args)
+
+    def _send_json(self, status: int, payload: Dict) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _job_or_404(self, job_id: str) -> Optional[Job]:
+        job = self.manager.get(job_id)
+        if job is None:
+            self._send_json(404, {"error": f"Unknown job {job_id}"})
+        return job
+
+    def do_POST(self) -> None:
+        if self.path.rstrip("/") != "/jobs":
+            self._send_json(404, {"error": "Not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(body, dict):
+                raise ValueError("Request body must be a JSON object")
+            job = self.manager.submit(body.get("query", ""), body.get("settings"))
+        except (ValueError, AttributeError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        except QueueFull as e:
+            self._send_json(429, {"error": str(e)})
+            return
+        self._send_json(202, {"job_id": job.id, "status": job.status})
+
+    def do_DELETE(self) -> None:
+        parts = self.path.strip("/").split("/")
+        if len(parts) != 2 or parts[0] != "jobs":
+            self._send_json(404, {"error": "Not found"})
+            return
+        job = self.manager.cancel(parts[1])
+        if job is None:
+            self._send_json(404, {"error": f"Unknown job {parts[1]}"})
+            return
+        self._send_json(200, job.to_dict())
+
+    def do_GET(self) -> None:
+        parts = self.path.strip("/").split("/")
+        if parts == ["health"]:
+            self._send_json(200, self.manager.counts())
+        elif len(parts) == 2 and parts[0] == "jobs":
+            job = self._job_or_404(parts[1])
+            if job is not None:
+                self._send_json(200, job.to_dict())
+        elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "result":
+            job = self._job_or_404(parts[1])
+            if job is None:
+                return
+            if not job.finished:
+                self._send_json(409, {"error": "Job has not finished", "status": job.status})
+            else:
+                self._send_json(200, {**job.to_dict(), "result": job.result})
+        elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "events":
+            job = self._job_or_404(parts[1])
+            if job is not None:
+                self._stream_events(job)
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def _stream_events(self, job: Job) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        sent = 0
+        while True:
+            with job.changed:
+                while sent == len(job.events) and not job.finished:
+                    job.changed.wait(timeout=15)
+                    if sent == len(job.events) and not job.finished:
+                        break
+                events = job.events[sent:]
+                done = job.finished
+            try:
+                if not events and not done:
+                    self.wfile.write(b": keep-alive\n\n")
+                for event in events:
+                    self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            sent += len(events)
+            if done and sent == len(job.events):
+                return
+
+
+def make_server(manager: JobManager, host: str = "127.0.0.1", port: int = 8080) -> ThreadingHTTPServer:
+    """
+    Builds (but does not start) the HTTP server; call serve_forever() on the result.
+    """
+    handler = type("BoundServiceHandler", (ServiceHandler,), {"manager": manager})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    import os
+    import argparse
+    import requests
+    from requests.adapters import HTTPAdapter
+    from src.pubmed_api import set_metadata_store, set_session
+    from src.mesh_index import load_mesh_index
+    from src.metadata_store import open_metadata_store
+
+    parser = argparse.ArgumentParser(description="PubMed summarizer job service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--max-queue", type=int, default=32)
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-job timeout in seconds")
+    parser.add_argument("--trace-memory", action="store_true", help="Record per-stage memory usage in job traces (process-wide figures; use --workers 1 for per-stage numbers)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=args.workers * 2)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    set_session(session)
+
+    mesh_index_path = os.getenv("MESH_INDEX_PATH", "")
+    mesh_index = load_mesh_index(mesh_index_path) if mesh_index_path and os.path.exists(mesh_index_path) else None
+
+    metadata_store_path = os.getenv("METADATA_STORE_PATH", "")
+    metadata_store = open_metadata_store(metadata_store_path)
+    set_metadata_store(metadata_store)
+
+    manager = JobManager(
+        workers=args.workers, max_queue=args.max_queue, job_timeout=args.timeout,
+        mesh_index=mesh_index, trace_memory=args.trace_memory
+    )
+    server = make_server(manager, args.host, args.port)
+    logger.info(f"Serving on http://{args.host}:{args.port} with {args.workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        manager.shutdown(wait=False)
+        if metadata_store_path:
+            metadata_store.save(metadata_store_path)
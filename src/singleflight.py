@@ -0,0 +1,123 @@
+# singleflight.py
+"""
+Coalescing of identical in-flight upstream calls.
+
+When several threads make the same request (same function, same arguments) at the
+same time, only the first one calls upstream; the others wait for it and share
+its result, or re-raise its exception. Nothing is cached after the call finishes.
+"""
+import copy
+import json
+import hashlib
+import inspect
+import threading
+import functools
+from typing import Any, Callable, Dict, Iterable
+
+from src.metrics import record
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls that share a key.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """
+        Runs fn() unless a call with the same key is already in flight, in which case
+        waits for that call and returns a copy of its result (or raises its exception).
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            record(coalesced=1)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            # Callers may mutate what they get back; don't let them share one object
+            return copy.deepcopy(call.result)
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+_groups: Dict[str, SingleFlight] = {}
+_groups_lock = threading.Lock()
+
+
+def get_group(name: str) -> SingleFlight:
+    with _groups_lock:
+        if name not in _groups:
+            _groups[name] = SingleFlight()
+        return _groups[name]
+
+
+def coalesced_counts() -> Dict[str, int]:
+    """
+    Number of calls that were served by another in-flight call, per coalesced function.
+    """
+    with _groups_lock:
+        return {name: group.coalesced for name, group in _groups.items()}
+
+
+def request_key(fn: Callable, args: tuple, kwargs: dict, normalize: Iterable[str] = ()) -> str:
+    """
+    Key for a call: a hash of the arguments bound to fn's signature (so positional and
+    keyword forms match), defaults applied. Only the string arguments named in normalize
+    are whitespace-normalized; everything else must match exactly.
+    """
+    bound = inspect.signature(fn).bind(*args, **kwargs)
+    bound.apply_defaults()
+    arguments = dict(bound.arguments)
+    for param in normalize:
+        if isinstance(arguments.get(param), str):
+            arguments[param] = " ".join(arguments[param].split())
+    encoded = json.dumps(arguments, sort_keys=True, default=repr).encode()
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+
+def coalesce(name: str, normalize: Iterable[str] = ()) -> Callable:
+    """
+    Decorator that routes calls through the SingleFlight group called `name`.
+
+    :param normalize: Names of query-like string parameters whose whitespace does not change
+        the upstream result (e.g. a PubMed search term), so calls that differ only there
+        are coalesced
+    """
+    normalize = tuple(normalize)
+
+    def decorator(fn: Callable) -> Callable:
+        group = get_group(name)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = request_key(fn, args, kwargs, normalize)
+            return group.do(key, lambda: fn(*args, **kwargs))
+        return wrapper
+    return decorator
@@ -1,7 +1,12 @@
 import os
-import openai
 from typing import List
+from src.metrics import record_usage
+from src.singleflight import coalesce
+from src.rate_limiter import INTERACTIVE, DEFAULT_COMPLETION_TOKENS, estimate_tokens, get_scheduler, request_timeout, scheduled_client
 
+client = scheduled_client(api_key=os.getenv("OPENAI_API_KEY", ""))
+
+@coalesce("chat_answer")
 def generate_answer(context_chunks: List[str], user_query: str, model_name: str = "gpt-3.5-turbo") -> str:
     """
     Forms the final answer using context (chunks) + user question.
@@ -40,11 +45,18 @@ def generate_answer(context_chunks: List[str], user_query: str, model_name: str
     ]
 
     # Call ChatCompletion (similar to how you did in your karpov code)
-    completion = openai.chat.completions.create(
-        model=model_name,
-        messages=messages,
-        temperature=0.7
+    completion = get_scheduler().call(
+        lambda: client.chat.completions.create(
+            model=model_name,
+            messages=messages,
+            temperature=0.7,
+            timeout=request_timeout()
+        ),
+        priority=INTERACTIVE,
+        est_tokens=estimate_tokens(messages, DEFAULT_COMPLETION_TOKENS),
+        model=model_name
     )
+    record_usage(completion)
 
     # Access the answer via choices[0].message.content
     answer = completion.choices[0].message.content
@@ -0,0 +1,87 @@
+import json
+from src.batch import load_questions, run_batch, write_jsonl
+from unittest.mock import patch
+
+def fake_search(query, start_date, end_date, retmax, most_relevant):
+    return {'(("doxorubicin"))': ["1", "2"], '(("microbiota"))': ["2", "3"]}.get(query, [])
+
+def fake_summaries(pmids):
+    return [{"pmid": p, "title": f"Title {p}", "journal": "J", "pubdate": "2023", "pubstatus": "pubmed"}
+            for p in pmids]
+
+def fake_index(articles, chunk_size=500):
+    return [{"pmid": a["pmid"], "chunk_text": a["abstract"], "embedding": [1.0]} for a in articles]
+
+def test_load_questions_text_and_jsonl(tmp_path):
+    text = tmp_path / "q.txt"
+    text.write_text("# comment\nfirst question\n\nsecond question\n")
+    assert [q["question"] for q in load_questions(str(text))] == ["first question", "second question"]
+
+    jsonl = tmp_path / "q.jsonl"
+    jsonl.write_text(json.dumps({"id": "a", "question": "q1", "settings": {"retmax": 3}}) + "\n")
+    assert load_questions(str(jsonl)) == [{"id": "a", "question": "q1", "settings": {"retmax": 3}}]
+
+@patch('src.pipeline.generate_answer', side_effect=lambda chunks, query, model_name: f"{query}: {len(chunks)}")
+@patch('src.pipeline.find_top_k', side_effect=lambda query, index, k: index[:k])
+@patch('src.pipeline.build_index', side_effect=fake_index)
+@patch('src.batch.get_summaries', side_effect=fake_summaries)
+@patch('src.pipeline.do_two_phase_search', side_effect=fake_search)
+def test_run_batch_fetches_and_embeds_each_article_once(mock_search, mock_summaries, mock_index, mock_top_k,
+                                                        mock_answer, tmp_path):
+    questions = [{"question": "doxorubicin"}, {"question": "microbiota"}, {"question": "nothing"}]
+    records = run_batch(questions, workers=2, use_keyword_extraction=False, use_synonyms=False)
+
+    mock_summaries.assert_called_once_with(["1", "2", "3"])
+    mock_index.assert_called_once()
+    assert [a["pmid"] for a in mock_index.call_args[0][0]] == ["1", "2", "3"]
+
+    assert [r["pmids"] for r in records] == [["1", "2"], ["2", "3"], []]
+    assert {c["pmid"] for c in records[1]["references"]} == {"2", "3"}
+    assert records[0]["answer"] == "doxorubicin: 2"
+    assert records[2]["halt"]
+    assert set(records[0]["timings"]) >= {"search", "retrieve", "answer"}
+    assert [s["stage"] for s in records[0]["shared_trace"]] == ["shared_summaries", "shared_build_index"]
+
+    out = tmp_path / "out.jsonl"
+    write_jsonl(records, str(out))
+    assert len(out.read_text().splitlines()) == 3
+
+def flaky_search(query, start_date, end_date, retmax, most_relevant):
+    if query == '(("broken"))':
+        raise RuntimeError("500 Server Error: esearch")
+    return fake_search(query, start_date, end_date, retmax, most_relevant)
+
+@patch('src.pipeline.generate_answer', side_effect=lambda chunks, query, model_name: f"{query}: {len(chunks)}")
+@patch('src.pipeline.find_top_k', side_effect=lambda query, index, k: index[:k])
+@patch('src.pipeline.build_index', side_effect=fake_index)
+@patch('src.batch.get_summaries', side_effect=fake_summaries)
+@patch('src.pipeline.do_two_phase_search', side_effect=flaky_search)
+def test_run_batch_reports_failed_questions(mock_search, mock_summaries, mock_index, mock_top_k, mock_answer):
+    questions = [{"question": "doxorubicin"}, {"question": "broken"}, {"question": "microbiota"}]
+    records = run_batch(questions, workers=2, use_keyword_extraction=False, use_synonyms=False)
+
+    assert len(records) == 3
+    assert records[1]["error"] == "RuntimeError: 500 Server Error: esearch"
+    assert records[1]["answer"] is None
+    assert records[0]["error"] is None and records[0]["answer"] == "doxorubicin: 2"
+    assert records[2]["answer"] == "microbiota: 2"
+    mock_summaries.assert_called_once_with(["1", "2", "3"])
+
+@patch('src.pipeline.generate_answer', side_effect=lambda chunks, query, model_name: f"{query}: {len(chunks)}")
+@patch('src.pipeline.find_top_k', side_effect=lambda query, index, k: index[:k])
+@patch('src.pipeline.build_index', side_effect=lambda articles, chunk_size: [
+    {"pmid": a["pmid"], "chunk_text": f"{chunk_size}", "embedding": [1.0]} for a in articles
+])
+@patch('src.batch.get_summaries', side_effect=fake_summaries)
+@patch('src.pipeline.do_two_phase_search', side_effect=fake_search)
+def test_run_batch_builds_one_index_per_chunk_size(mock_search, mock_summaries, mock_index, mock_top_k,
+                                                   mock_answer):
+    questions = [{"question": "doxorubicin"}, {"question": "microbiota", "settings": {"chunk_size": 100}}]
+    records = run_batch(questions, workers=2, use_keyword_extraction=False, use_synonyms=False, chunk_size=300)
+
+    mock_summaries.assert_called_once_with(["1", "2", "3"])
+    calls = sorted((c.kwargs["chunk_size"], [a["pmid"] for a in c.args[0]]) for c in mock_index.call_args_list)
+    assert calls == [(100, ["2", "3"]), (300, ["1", "2"])]
+    assert {c["chunk_text"] for c in records[0]["references"]} == {"300"}
+    assert {c["chunk_text"] for c in records[1]["references"]} == {"100"}
+    assert [s.get("chunk_size") for s in records[1]["shared_trace"]] == [None, 300, 100]
@@ -6,7 +6,7 @@ def test_extract_keywords():
     mock_response = MagicMock()
     mock_response.choices = [MagicMock(message=MagicMock(content="microbiology, microbiota, health"))]
     
-    with patch('src.keyword_extraction.openai.chat.completions.create', return_value=mock_response):
+    with patch('src.keyword_extraction.client.chat.completions.create', return_value=mock_response):
         result = extract_keywords("Tell me about the latest news in microbiology and human health")
         
         assert isinstance(result, str)
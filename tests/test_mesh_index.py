@@ -0,0 +1,80 @@
+import pytest
+from src.mesh_index import build_mesh_index, load_mesh_index
+from src.enhanced_search import build_refined_query_with_mesh
+
+DESC_XML = """<?xml version="1.0"?>
+<DescriptorRecordSet LanguageCode="eng">
+  <DescriptorRecord>
+    <DescriptorUI>D004317</DescriptorUI>
+    <DescriptorName><String>Doxorubicin</String></DescriptorName>
+    <TreeNumberList><TreeNumber>D02.455.426.559.389.657.410.595.300</TreeNumber></TreeNumberList>
+    <ConceptList><Concept><TermList>
+      <Term><String>Doxorubicin</String></Term>
+      <Term><String>Adriamycin</String></Term>
+    </TermList></Concept></ConceptList>
+  </DescriptorRecord>
+  <DescriptorRecord>
+    <DescriptorUI>D009369</DescriptorUI>
+    <DescriptorName><String>Neoplasms</String></DescriptorName>
+    <TreeNumberList><TreeNumber>C04</TreeNumber></TreeNumberList>
+    <ConceptList><Concept><TermList>
+      <Term><String>Tumors</String></Term>
+      <Term><String>Cancer</String></Term>
+    </TermList></Concept></ConceptList>
+  </DescriptorRecord>
+  <DescriptorRecord>
+    <DescriptorUI>D001943</DescriptorUI>
+    <DescriptorName><String>Breast Neoplasms</String></DescriptorName>
+    <TreeNumberList><TreeNumber>C04.588.180</TreeNumber></TreeNumberList>
+    <ConceptList><Concept><TermList>
+      <Term><String>Breast Cancer</String></Term>
+    </TermList></Concept></ConceptList>
+  </DescriptorRecord>
+</DescriptorRecordSet>
+"""
+
+@pytest.fixture
+def mesh_index(tmp_path):
+    xml_path = tmp_path / "desc.xml"
+    xml_path.write_text(DESC_XML)
+    idx_path = tmp_path / "mesh.idx"
+    assert build_mesh_index(str(xml_path), str(idx_path)) == 3
+    with load_mesh_index(str(idx_path)) as idx:
+        yield idx
+
+def test_lookup_entry_terms(mesh_index):
+    assert len(mesh_index) == 3
+    assert [d["ui"] for d in mesh_index.lookup("adriamycin")] == ["D004317"]
+    assert mesh_index.lookup("  CANCER ")[0]["name"] == "Neoplasms"
+    assert mesh_index.lookup("unknown term") == []
+
+def test_prefix_and_tree_search(mesh_index):
+    assert {d["name"] for d in mesh_index.search_prefix("breast")} == {"Breast Neoplasms"}
+    assert {d["name"] for d in mesh_index.descendants("C04")} == {"Neoplasms", "Breast Neoplasms"}
+    assert mesh_index.descendants("C04.588.180")[0]["tree_numbers"] == ["C04.588.180"]
+
+def test_build_refined_query_with_mesh_index(mesh_index):
+    query = build_refined_query_with_mesh(["adriamycin"], {"adriamycin": ["dox"]}, mesh_index=mesh_index)
+    assert query == '(("adriamycin" OR "dox" OR "Doxorubicin"[MeSH Terms]))'
+
+def test_rejects_non_index_file(tmp_path):
+    bogus = tmp_path / "bogus.idx"
+    bogus.write_bytes(b"\x00" * 64)
+    with pytest.raises(ValueError):
+        load_mesh_index(str(bogus))
+
+@pytest.mark.parametrize("content", [b"", b"MESHIDX1"])
+def test_rejects_empty_or_short_file(tmp_path, content):
+    short = tmp_path / "short.idx"
+    short.write_bytes(content)
+    with pytest.raises(ValueError):
+        load_mesh_index(str(short))
+
+def test_rejects_truncated_index(tmp_path):
+    xml_path = tmp_path / "desc.xml"
+    xml_path.write_text(DESC_XML)
+    idx_path = tmp_path / "mesh.idx"
+    build_mesh_index(str(xml_path), str(idx_path))
+    idx_path.write_bytes(idx_path.read_bytes()[:-16])
+    with pytest.raises(ValueError):
+        load_mesh_index(str(idx_path))
@@ -0,0 +1,137 @@
+import pytest
+from unittest.mock import patch, MagicMock
+from src.metadata_store import ArticleMetadataStore, open_metadata_store, parse_pubdate
+from src.pubmed_api import get_summaries, set_metadata_store
+
+SUMMARIES = [
+    {"pmid": "1", "title": "Statins in CKD", "journal": "Kidney Int", "pubdate": "2021 Mar 4", "pubstatus": "medline"},
+    {"pmid": "2", "title": "Aspirin trial", "journal": "Lancet", "pubdate": "2019 Winter", "pubstatus": "pubmed"},
+    {"pmid": "3", "title": "Preprint", "journal": "Lancet", "pubdate": "2023", "pubstatus": "aheadofprint"},
+]
+
+EFETCH_XML = b"""<PubmedArticleSet>
+<PubmedArticle><MedlineCitation><PMID>1</PMID><MeshHeadingList>
+<MeshHeading><DescriptorName UI="D006973">Hypertension</DescriptorName></MeshHeading>
+<MeshHeading><DescriptorName UI="D007676">Kidney Failure, Chronic</DescriptorName></MeshHeading>
+</MeshHeadingList></MedlineCitation></PubmedArticle>
+<PubmedArticle><MedlineCitation><PMID>2</PMID><MeshHeadingList>
+<MeshHeading><DescriptorName UI="D001241">Aspirin</DescriptorName></MeshHeading>
+</MeshHeadingList></MedlineCitation></PubmedArticle>
+</PubmedArticleSet>"""
+
+@pytest.fixture
+def store():
+    store = ArticleMetadataStore()
+    store.add_summaries(SUMMARIES)
+    store.add_efetch_xml(EFETCH_XML)
+    return store
+
+def test_parse_pubdate():
+    assert parse_pubdate("2023 Jan 15") == (20230115, 20230115)
+    assert parse_pubdate("2023 Feb") == (20230201, 20230228)
+    assert parse_pubdate("2024 Feb") == (20240201, 20240229)
+    assert parse_pubdate("2022 Winter") == (20221201, 20221231)
+    # ranges keep their end
+    assert parse_pubdate("2023 Jan-Feb") == (20230101, 20230228)
+    assert parse_pubdate("2022 Nov-Dec") == (20221101, 20221231)
+    assert parse_pubdate("2023 Dec 15-21") == (20231215, 20231221)
+    assert parse_pubdate("2023 Jan 30-Feb 5") == (20230130, 20230205)
+    assert parse_pubdate("2023 Dec-2024 Jan") == (20231201, 20240131)
+    assert parse_pubdate("2023") == (20230101, 20231231)
+    assert parse_pubdate("") == (0, 0)
+
+def test_filter(store):
+    assert store.filter(start_date="2021/01/01") == ["1", "3"]
+    assert store.filter(end_date="2020-12-31") == ["2"]
+    assert store.filter(statuses=["MEDLINE", "pubmed"]) == ["1", "2"]
+    assert store.filter(journals=["Lancet"], start_date="2020/01/01") == ["3"]
+    assert store.filter(mesh_ids=["D001241", "D007676"]) == ["1", "2"]
+    # restricted to and ordered as the given PMIDs, unknown ones dropped
+    assert store.filter(["3", "2", "99"], journals=["Lancet"]) == ["3", "2"]
+    assert store.filter(journals=["Unknown"]) == []
+
+def test_filter_matches_end_of_pubdate_range():
+    store = ArticleMetadataStore()
+    store.add_summaries([{"pmid": "5", "title": "", "journal": "J", "pubdate": "2023 Jan-Feb", "pubstatus": "pubmed"}])
+    assert store.filter(start_date="2023/02/01") == ["5"]
+    assert store.filter(start_date="2023/03/01") == []
+
+def test_update_existing_row(store):
+    store.add_summaries([dict(SUMMARIES[2], pubstatus="pubmed")])
+    assert len(store) == 3
+    assert store.filter(statuses=["pubmed"]) == ["2", "3"]
+
+def test_save_load_roundtrip(store, tmp_path):
+    path = str(tmp_path / "articles.npz")
+    store.save(path)
+    loaded = ArticleMetadataStore.load(path)
+
+    assert loaded.get_summaries(["3", "1"]) == store.get_summaries(["3", "1"])
+    assert loaded.filter(mesh_ids=["D006973"]) == ["1"]
+    loaded.add_summaries([{"pmid": "4", "title": "New", "journal": "BMJ", "pubdate": "2024", "pubstatus": "pubmed"}])
+    assert loaded.filter(journals=["BMJ"]) == ["4"]
+
+def test_get_summaries_only_fetches_missing(store):
+    mock_response = MagicMock()
+    mock_response.json.return_value = {
+        "result": {"4": {"title": "New", "fulljournalname": "BMJ", "pubdate": "2024", "pubstatus": "pubmed"}}
+    }
+    set_metadata_store(store)
+    try:
+        with patch('src.pubmed_api.requests.get', return_value=mock_response) as mock_get:
+            summaries = get_summaries(["1", "4"])
+    finally:
+        set_metadata_store(None)
+
+    assert mock_get.call_args.kwargs["params"]["id"] == "4"
+    assert [s["pmid"] for s in summaries] == ["1", "4"]
+    assert "4" in store
+
+def test_stale_rows_are_fetched_again(store):
+    store.max_age = 3600
+    assert store.missing(["1", "2", "99"]) == ["99"]
+    store.fetched_at[store._row["3"]] -= 7200
+    assert store.missing(["1", "3"]) == ["3"]
+
+    mock_response = MagicMock()
+    mock_response.json.return_value = {
+        "result": {"3": {"title": "Preprint", "fulljournalname": "Lancet", "pubdate": "2023", "pubstatus": "medline"}}
+    }
+    set_metadata_store(store)
+    try:
+        with patch('src.pubmed_api.requests.get', return_value=mock_response) as mock_get:
+            summaries = get_summaries(["1", "3"])
+    finally:
+        set_metadata_store(None)
+
+    assert mock_get.call_args.kwargs["params"]["id"] == "3"
+    assert summaries[1]["pubstatus"] == "medline"
+    assert store.missing(["3"]) == []
+
+def test_open_metadata_store(store, tmp_path, monkeypatch):
+    path = str(tmp_path / "articles.npz")
+    monkeypatch.setenv("METADATA_STORE_MAX_AGE_HOURS", "0")
+    assert len(open_metadata_store(path)) == 0
+    store.save(path)
+    loaded = open_metadata_store(path)
+    assert len(loaded) == 3 and loaded.max_age is None
+
+def test_save_replaces_file_atomically(store, tmp_path):
+    path = tmp_path / "articles.npz"
+    store.save(str(path))
+    with patch("src.metadata_store.np.savez_compressed", side_effect=KeyboardInterrupt):
+        with pytest.raises(KeyboardInterrupt):
+            store.save(str(path))
+    # the previous file is intact and no temporary file is left behind
+    assert len(ArticleMetadataStore.load(str(path))) == 3
+    assert [p.name for p in tmp_path.iterdir()] == ["articles.npz"]
+
+def test_open_metadata_store_quarantines_unreadable_file(store, tmp_path):
+    path = tmp_path / "articles.npz"
+    store.save(str(path))
+    path.write_bytes(path.read_bytes()[:100])  # truncated mid-write
+
+    opened = open_metadata_store(str(path))
+    assert len(opened) == 0
+    assert (tmp_path / "articles.npz.corrupt").exists()
+    assert not path.exists()
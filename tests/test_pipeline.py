@@ -0,0 +1,118 @@
+import json
+import threading
+import tracemalloc
+import pytest
+from src.metrics import StageStats, record, track
+from src.pipeline import Pipeline, build_search_pipeline, build_followup_pipeline, followup_state, new_state
+from unittest.mock import patch, MagicMock
+
+def test_pipeline_records_stage_counters(tmp_path):
+    def fetch(state):
+        record(api_calls=2, bytes_downloaded=100)
+        state["fetched"] = True
+
+    def embed(state):
+        record(api_calls=1, tokens_in=50)
+
+    trace_path = tmp_path / "trace.jsonl"
+    result = Pipeline([("fetch", fetch), ("embed", embed)]).run({}, trace_path=str(trace_path))
+
+    assert result.state["fetched"]
+    assert [s["stage"] for s in result.trace_dicts()] == ["fetch", "embed"]
+    assert result.trace[0].counters["bytes_downloaded"] == 100
+    assert result.trace[1].counters["tokens_in"] == 50
+
+    lines = [json.loads(line) for line in trace_path.read_text().splitlines()]
+    assert len(lines) == 2
+    assert all(line["run_id"] == result.run_id for line in lines)
+
+def test_pipeline_stops_on_halt():
+    def stop(state):
+        state["halt"] = "nothing found"
+
+    never = MagicMock()
+    result = Pipeline([("stop", stop), ("never", never)]).run({})
+    assert result.halted == "nothing found"
+    assert len(result.trace) == 1
+    never.assert_not_called()
+
+def test_new_state_rejects_unknown_settings():
+    with pytest.raises(ValueError):
+        new_state("query", not_a_setting=True)
+
+@patch('src.pipeline.generate_answer', return_value="answer")
+@patch('src.pipeline.find_top_k', return_value=[{"pmid": "1", "chunk_text": "chunk"}])
+@patch('src.pipeline.build_index', return_value=[])
+@patch('src.pipeline.get_summaries', return_value=[{"pmid": "1", "title": "T", "pubdate": "2023", "pubstatus": "pubmed"}])
+@patch('src.pipeline.do_two_phase_search', return_value=["1"])
+def test_default_pipeline_end_to_end(mock_search, mock_summaries, mock_index, mock_top_k, mock_answer):
+    state = new_state("doxorubicin", use_keyword_extraction=False, use_synonyms=False)
+    result = build_search_pipeline().run(state)
+
+    assert result.halted is None
+    assert state["query_str"] == '(("doxorubicin"))'
+    assert state["answer"] == "answer"
+    assert len(result.trace) == 9
+
+@patch('src.pipeline.generate_answer', return_value="follow-up answer")
+@patch('src.pipeline.find_top_k', return_value=[{"pmid": "1", "chunk_text": "chunk"}])
+def test_followup_reuses_index(mock_top_k, mock_answer):
+    searched = new_state("first question")
+    searched.update({"pmids": ["1"], "rag_index": [{"pmid": "1", "chunk_text": "chunk", "embedding": [1.0]}],
+                     "answer": "old answer"})
+
+    result = build_followup_pipeline().run(followup_state(searched, "second question"))
+
+    assert result.state["answer"] == "follow-up answer"
+    assert searched["answer"] == "old answer"
+    assert mock_top_k.call_args[0][0] == "second question"
+    assert result.trace[0].counters["cache_hits"] == 1
+
+def test_followup_without_index_halts():
+    result = build_followup_pipeline().run(followup_state(new_state("q"), "again"))
+    assert result.halted
+
+def test_pipeline_trace_memory():
+    def allocate(state):
+        state["blob"] = bytearray(2_000_000)
+
+    try:
+        result = Pipeline([("allocate", allocate)]).run({}, trace_memory=True)
+    finally:
+        tracemalloc.stop()
+    memory = result.trace_dicts()[0]
+    assert memory["alloc_peak_bytes"] >= 2_000_000
+    assert memory["alloc_bytes"] >= 2_000_000
+    assert "rss_peak_bytes" in memory and "rss_delta_bytes" in memory
+    assert memory["overlapped"] is False
+
+def test_concurrent_traced_stages_keep_their_peaks():
+    allocated, b_done = threading.Event(), threading.Event()
+    stats = {name: StageStats(name) for name in ("a", "b")}
+
+    def stage_a():
+        with track(stats["a"], trace_memory=True):
+            blob = bytearray(20_000_000)
+            del blob
+            allocated.set()
+            # traced stages are not serialized: b runs to completion inside a
+            b_done.wait(timeout=5)
+
+    def stage_b():
+        allocated.wait(timeout=5)
+        with track(stats["b"], trace_memory=True):
+            pass
+        b_done.set()
+
+    threads = [threading.Thread(target=stage_a), threading.Thread(target=stage_b)]
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout=5)
+    finally:
+        tracemalloc.stop()
+    assert b_done.is_set()
+    # b must not reset the peak while a is running
+    assert stats["a"].memory["alloc_peak_bytes"] >= 20_000_000
+    assert stats["a"].memory["overlapped"] and stats["b"].memory["overlapped"]
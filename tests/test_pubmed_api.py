@@ -1,5 +1,5 @@
 import pytest
-from src.pubmed_api import search_pubmed, get_summaries, filter_medline_summaries, fetch_abstracts
+from src.pubmed_api import search_pubmed, get_summaries, filter_medline_summaries, fetch_abstracts, set_session
 from unittest.mock import patch, MagicMock
 
 def test_search_pubmed():
@@ -38,4 +38,14 @@ def test_get_summaries():
     with patch('src.pubmed_api.requests.get', return_value=mock_response):
         summaries = get_summaries(["12345"])
         assert len(summaries) == 1
-        assert all(key in summaries[0] for key in ["pmid", "title", "journal", "pubdate", "pubstatus"]) 
\ No newline at end of file
+        assert all(key in summaries[0] for key in ["pmid", "title", "journal", "pubdate", "pubstatus"]) 
+def test_set_session_routes_requests():
+    session = MagicMock()
+    session.get.return_value.json.return_value = {"esearchresult": {"idlist": ["1"]}}
+
+    set_session(session)
+    try:
+        assert search_pubmed("test query", "", "", retmax=1) == ["1"]
+    finally:
+        set_session(None)
+    session.get.assert_called_once()
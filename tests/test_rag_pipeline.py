@@ -1,5 +1,6 @@
 import pytest
-from src.rag_pipeline import chunk_text, build_index, find_top_k, cosine_similarity
+import numpy as np
+from src.rag_pipeline import chunk_text, build_index, build_index_streaming, find_top_k, find_top_k_streaming, cosine_similarity
 from unittest.mock import patch
 
 def test_chunk_text():
@@ -40,4 +41,29 @@ def test_find_top_k(mock_create_embeddings, mock_embedding_vector):
     
     results = find_top_k("test query", test_index, k=2)
     assert len(results) == 2
-    assert all(isinstance(item, dict) for item in results) 
\ No newline at end of file
+    assert all(isinstance(item, dict) for item in results) 
+@patch('src.rag_pipeline.create_embeddings')
+def test_build_index_streaming_segments(mock_create_embeddings):
+    mock_create_embeddings.side_effect = lambda chunks, **kwargs: [(c, [1.0, 0.0]) for c in chunks]
+
+    def articles():
+        for i in range(5):
+            yield {"pmid": str(i), "abstract": "x" * 25}
+
+    segments = list(build_index_streaming(articles(), chunk_size=10, segment_size=4))
+    assert [len(s) for s in segments] == [4, 4, 4, 3]
+    assert mock_create_embeddings.call_count == 4
+    assert segments[0][0]["embedding"].dtype == np.float32
+    assert [item["pmid"] for item in segments[0]] == ["0", "0", "0", "1"]
+
+@patch('src.rag_pipeline.create_embeddings')
+def test_find_top_k_streaming_matches_find_top_k(mock_create_embeddings):
+    mock_create_embeddings.return_value = [("query", [1.0, 0.0, 0.0])]
+    index = [
+        {"pmid": "1", "chunk_text": "a", "embedding": [0.0, 1.0, 0.0]},
+        {"pmid": "2", "chunk_text": "b", "embedding": [1.0, 0.1, 0.0]},
+        {"pmid": "3", "chunk_text": "c", "embedding": [0.0, 0.0, 0.0]},
+        {"pmid": "4", "chunk_text": "d", "embedding": [0.7, 0.7, 0.0]},
+    ]
+    streamed = find_top_k_streaming("query", [index[:2], index[2:]], k=2)
+    assert [x["pmid"] for x in streamed] == [x["pmid"] for x in find_top_k("query", index, k=2)] == ["2", "4"]
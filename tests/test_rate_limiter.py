@@ -0,0 +1,171 @@
+import threading
+import time
+import httpx
+import openai
+import pytest
+from src import deadline
+from src.rate_limiter import (
+    OpenAIScheduler, INTERACTIVE, BACKGROUND, DEFAULT_MODEL, estimate_tokens, parse_reset,
+    scheduled_client, scheduled_http_client
+)
+
+def rate_limit_error(retry_after_ms: str = "1") -> openai.RateLimitError:
+    response = httpx.Response(
+        429, headers={"retry-after-ms": retry_after_ms},
+        request=httpx.Request("POST", "https://api.openai.com/v1/embeddings")
+    )
+    return openai.RateLimitError("Rate limit reached", response=response, body=None)
+
+def test_parse_reset():
+    assert parse_reset("20ms") == pytest.approx(0.02)
+    assert parse_reset("6m0s") == pytest.approx(360.0)
+    assert parse_reset("1h2m3.5s") == pytest.approx(3723.5)
+    assert parse_reset("1.5") == pytest.approx(1.5)
+    assert parse_reset("") is None
+
+def test_estimate_tokens():
+    assert estimate_tokens("a" * 400) == 104
+    messages = [{"role": "system", "content": "a" * 40}, {"role": "user", "content": "b" * 40}]
+    assert estimate_tokens(messages, completion_tokens=100) == 128
+
+def test_observe_headers_updates_budgets_per_model():
+    scheduler = OpenAIScheduler(rpm=500, tpm=200_000)
+    scheduler.observe_headers({
+        "x-ratelimit-limit-requests": "60",
+        "x-ratelimit-remaining-requests": "10",
+        "x-ratelimit-limit-tokens": "10000",
+        "x-ratelimit-remaining-tokens": "9000",
+    }, model="gpt-4")
+    gpt4 = scheduler.model_state("gpt-4")
+    assert gpt4.requests.capacity == 60
+    assert gpt4.requests.level == pytest.approx(10, abs=0.1)
+    assert gpt4.tokens.capacity == 10_000
+    # other models keep their own budgets
+    assert scheduler.model_state("text-embedding-ada-002").tokens.capacity == 200_000
+
+def test_response_hook_reads_model_from_request():
+    scheduler = OpenAIScheduler()
+    request = httpx.Request("POST", "https://api.openai.com/v1/embeddings",
+                            json={"model": "text-embedding-ada-002", "input": ["a"]})
+    response = httpx.Response(200, headers={"x-ratelimit-limit-tokens": "1000000"}, request=request)
+    scheduler.httpx_response_hook(response)
+    assert scheduler.model_state("text-embedding-ada-002").tokens.capacity == 1_000_000
+    assert scheduler.model_state("gpt-4").tokens.capacity == 200_000
+
+def test_retries_after_429_and_halves_concurrency():
+    scheduler = OpenAIScheduler(initial_concurrency=8)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise rate_limit_error()
+        return "ok"
+
+    assert scheduler.call(flaky, model="gpt-4") == "ok"
+    assert len(attempts) == 2
+    assert scheduler.throttled == 1
+    assert scheduler.model_state("gpt-4").concurrency < 8
+    assert scheduler.model_state("gpt-4").in_flight == 0
+    assert scheduler.model_state("text-embedding-ada-002").concurrency == 8
+
+def test_pause_of_one_model_does_not_block_another():
+    scheduler = OpenAIScheduler()
+    scheduler.model_state("gpt-4").paused_until = time.monotonic() + 60
+    started = time.monotonic()
+    assert scheduler.call(lambda: "ok", model="text-embedding-ada-002") == "ok"
+    assert time.monotonic() - started < 1
+
+def test_gives_up_after_max_retries():
+    scheduler = OpenAIScheduler(max_retries=1)
+
+    def always_limited():
+        raise rate_limit_error()
+
+    with pytest.raises(openai.RateLimitError):
+        scheduler.call(always_limited)
+    assert scheduler.model_state(DEFAULT_MODEL).in_flight == 0
+
+def test_interactive_calls_run_before_background():
+    scheduler = OpenAIScheduler(initial_concurrency=1, max_concurrency=1)
+    release = threading.Event()
+    order = []
+
+    state = scheduler.model_state(DEFAULT_MODEL)
+    blocker = threading.Thread(target=scheduler.call, args=(lambda: release.wait(timeout=5),))
+    blocker.start()
+    while state.in_flight == 0:
+        time.sleep(0.001)
+
+    waiters = []
+    for name, priority in (("embedding", BACKGROUND), ("answer", INTERACTIVE)):
+        t = threading.Thread(target=scheduler.call, args=(lambda n=name: order.append(n),), kwargs={"priority": priority})
+        t.start()
+        waiters.append(t)
+    while len(state.waiting) < 2:
+        time.sleep(0.001)
+
+    release.set()
+    for t in [blocker] + waiters:
+        t.join(timeout=5)
+    assert order == ["answer", "embedding"]
+
+def test_429_is_retried_only_by_the_scheduler():
+    sent = []
+
+    def handler(request):
+        sent.append(request)
+        return httpx.Response(429, headers={"retry-after-ms": "1"}, json={"error": {"message": "Rate limit"}})
+
+    http_client = scheduled_http_client(transport=httpx.MockTransport(handler))
+    client = scheduled_client(api_key="x", http_client=http_client)
+    scheduler = OpenAIScheduler(max_retries=2)
+
+    with pytest.raises(openai.RateLimitError):
+        scheduler.call(lambda: client.embeddings.create(input=["a"], model="text-embedding-ada-002"))
+    # one request per scheduler attempt, none from the SDK
+    assert len(sent) == 3
+    assert scheduler.throttled == 3
+
+def test_module_clients_do_not_retry():
+    from src import embeddings, enhanced_search, keyword_extraction, summarizer
+    for module in (embeddings, enhanced_search, keyword_extraction, summarizer):
+        assert module.client.max_retries == 0
+    # the openai module's own client is left alone
+    assert openai.max_retries == openai.DEFAULT_MAX_RETRIES
+
+EMBEDDING_BODY = {
+    "object": "list", "model": "text-embedding-ada-002",
+    "data": [{"object": "embedding", "index": 0, "embedding": [0.1]}],
+    "usage": {"prompt_tokens": 1, "total_tokens": 1},
+}
+
+@pytest.mark.parametrize("failure", [
+    lambda request: httpx.Response(503, json={"error": {"message": "overloaded"}}),
+    lambda request: (_ for _ in ()).throw(httpx.ConnectError("connection reset", request=request)),
+])
+def test_transient_errors_are_retried_with_backoff(failure):
+    sent = []
+
+    def handler(request):
+        sent.append(request)
+        return failure(request) if len(sent) == 1 else httpx.Response(200, json=EMBEDDING_BODY)
+
+    client = scheduled_client(api_key="x", http_client=scheduled_http_client(transport=httpx.MockTransport(handler)))
+    scheduler = OpenAIScheduler(backoff=0.001)
+    response = scheduler.call(lambda: client.embeddings.create(input=["a"], model="text-embedding-ada-002"))
+
+    assert response.data[0].embedding == [0.1]
+    assert len(sent) == 2
+    assert scheduler.throttled == 0
+    assert scheduler.model_state(DEFAULT_MODEL).in_flight == 0
+
+def test_waiting_for_a_slot_stops_at_the_deadline():
+    scheduler = OpenAIScheduler()
+    scheduler.model_state("gpt-4").paused_until = time.monotonic() + 60
+    started = time.monotonic()
+    with deadline.scope(time.monotonic() + 0.1):
+        with pytest.raises(deadline.DeadlineExceeded):
+            scheduler.call(lambda: "never sent", model="gpt-4")
+    assert time.monotonic() - started < 1
+    assert scheduler.model_state("gpt-4").waiting == []
@@ -0,0 +1,200 @@
+import json
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+import pytest
+from unittest.mock import patch
+from src.pipeline import Pipeline
+from src.pubmed_api import http_get
+from src.rate_limiter import OpenAIScheduler, scheduled_client
+from src.service import Job, JobManager, QueueFull, make_server, SUCCEEDED, CANCELLED, TIMED_OUT, FAILED
+
+def wait_finished(job, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not job.finished and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return job
+
+def answer_pipeline():
+    def answer(state):
+        state["answer"] = f"answer to {state['user_query']}"
+        state["top_chunks"] = [{"pmid": "1", "chunk_text": "chunk", "embedding": [0.1]}]
+    return Pipeline([("answer", answer)])
+
+def blocking_pipeline(release: threading.Event):
+    def block(state):
+        release.wait(timeout=5)
+    return lambda: Pipeline([("block", block), ("after", lambda state: None)])
+
+def test_job_runs_to_completion():
+    manager = JobManager(workers=2, pipeline_factory=answer_pipeline)
+    job = wait_finished(manager.submit("question"))
+    manager.shutdown()
+
+    assert job.status == SUCCEEDED
+    assert job.result["answer"] == "answer to question"
+    assert job.result["references"] == [{"pmid": "1", "chunk_text": "chunk"}]
+    assert [e["stage"] for e in job.result["trace"]] == ["answer"]
+
+def test_queue_depth_limit_and_cancel():
+    release = threading.Event()
+    manager = JobManager(workers=1, max_queue=1, pipeline_factory=blocking_pipeline(release))
+    running = manager.submit("first")
+    while running.status != "running":
+        time.sleep(0.01)
+    queued = manager.submit("second")
+    with pytest.raises(QueueFull):
+        manager.submit("third")
+
+    manager.cancel(queued.id)
+    manager.cancel(running.id)
+    release.set()
+    manager.shutdown()
+
+    assert queued.status == CANCELLED
+    assert wait_finished(running).status == CANCELLED
+
+def test_job_timeout():
+    release = threading.Event()
+    manager = JobManager(workers=1, job_timeout=0.05, pipeline_factory=blocking_pipeline(release))
+    job = manager.submit("slow")
+    time.sleep(0.1)
+    release.set()
+    assert wait_finished(job).status == TIMED_OUT
+    manager.shutdown()
+
+def test_job_timeout_interrupts_stalled_request():
+    # Accepts connections (via the listen backlog) but never answers
+    stalled = socket.socket()
+    stalled.bind(("127.0.0.1", 0))
+    stalled.listen(1)
+    url = f"http://127.0.0.1:{stalled.getsockname()[1]}/esearch.fcgi"
+
+    manager = JobManager(workers=1, job_timeout=0.3,
+                         pipeline_factory=lambda: Pipeline([("search", lambda state: http_get(url, {}))]))
+    started = time.monotonic()
+    try:
+        job = wait_finished(manager.submit("question"))
+    finally:
+        manager.shutdown()
+        stalled.close()
+    assert job.status == TIMED_OUT
+    assert time.monotonic() - started < 3
+
+def test_job_timeout_interrupts_stalled_openai_call():
+    from src.summarizer import generate_answer
+
+    stalled = socket.socket()
+    stalled.bind(("127.0.0.1", 0))
+    stalled.listen(1)
+    client = scheduled_client(api_key="x", base_url=f"http://127.0.0.1:{stalled.getsockname()[1]}/v1")
+
+    manager = JobManager(workers=1, job_timeout=0.3, pipeline_factory=lambda: Pipeline([
+        ("answer", lambda state: generate_answer(["context"], state["user_query"]))
+    ]))
+    started = time.monotonic()
+    try:
+        with patch("src.summarizer.client", client):
+            job = wait_finished(manager.submit("question"))
+    finally:
+        manager.shutdown()
+        stalled.close()
+    assert job.status == TIMED_OUT
+    assert time.monotonic() - started < 3
+
+def test_cancel_interrupts_wait_for_openai_slot():
+    scheduler = OpenAIScheduler()
+    scheduler.model_state("gpt-4").paused_until = time.monotonic() + 60
+    manager = JobManager(workers=1, pipeline_factory=lambda: Pipeline([
+        ("answer", lambda state: scheduler.call(lambda: "never sent", model="gpt-4"))
+    ]))
+    job = manager.submit("question")
+    while job.status != "running":
+        time.sleep(0.01)
+    manager.cancel(job.id)
+    assert wait_finished(job, timeout=2).status == CANCELLED
+    manager.shutdown()
+    assert scheduler.model_state("gpt-4").waiting == []
+
+def test_cancelled_job_is_not_restarted():
+    manager = JobManager(workers=1, pipeline_factory=answer_pipeline)
+    job = Job("question", {})
+    job.set_status(CANCELLED)
+    manager._run(job)
+    manager.shutdown()
+    assert job.status == CANCELLED
+    assert [e["status"] for e in job.events] == [CANCELLED]
+
+def test_failed_job_reports_error():
+    def boom(state):
+        raise RuntimeError("upstream down")
+    manager = JobManager(workers=1, pipeline_factory=lambda: Pipeline([("boom", boom)]))
+    job = wait_finished(manager.submit("question"))
+    manager.shutdown()
+    assert job.status == FAILED
+    assert "upstream down" in job.error
+
+def test_submit_rejects_unknown_settings():
+    manager = JobManager(workers=1, pipeline_factory=answer_pipeline)
+    with pytest.raises(ValueError):
+        manager.submit("question", {"mesh_index": "/etc/passwd"})
+    manager.shutdown()
+
+@pytest.mark.parametrize("query, settings", [
+    (5, None),
+    ("question", 5),
+    ("question", {"retmax": "10"}),
+    ("question", {"retmax": 0}),
+    ("question", {"most_relevant": 1}),
+    ("question", {"top_k": True}),
+    ("question", {"start_date": "2023-01-01"}),
+])
+def test_submit_rejects_mistyped_input(query, settings):
+    manager = JobManager(workers=1, pipeline_factory=answer_pipeline)
+    with pytest.raises(ValueError):
+        manager.submit(query, settings)
+    manager.shutdown()
+
+def test_http_api_rejects_malformed_bodies():
+    manager = JobManager(workers=1, pipeline_factory=answer_pipeline)
+    server = make_server(manager, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        for body in ({"query": "q", "settings": 5}, {"query": ["q"]}, [1, 2], "q"):
+            request = urllib.request.Request(f"{base}/jobs", data=json.dumps(body).encode(), method="POST")
+            with pytest.raises(urllib.error.HTTPError) as excinfo:
+                urllib.request.urlopen(request)
+            assert excinfo.value.code == 400
+            assert "error" in json.load(excinfo.value)
+    finally:
+        server.shutdown()
+        server.server_close()
+        manager.shutdown()
+
+def test_http_api_round_trip():
+    manager = JobManager(workers=1, pipeline_factory=answer_pipeline)
+    server = make_server(manager, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        request = urllib.request.Request(
+            f"{base}/jobs", data=json.dumps({"query": "question"}).encode(), method="POST"
+        )
+        with urllib.request.urlopen(request) as resp:
+            assert resp.status == 202
+            job_id = json.load(resp)["job_id"]
+
+        with urllib.request.urlopen(f"{base}/jobs/{job_id}/events") as resp:
+            events = [json.loads(line[len("data: "):]) for line in resp.read().decode().splitlines()
+                      if line.startswith("data: ")]
+        assert events[-1] == {"event": "status", "status": SUCCEEDED, "error": None}
+
+        with urllib.request.urlopen(f"{base}/jobs/{job_id}/result") as resp:
+            assert json.load(resp)["result"]["answer"] == "answer to question"
+    finally:
+        server.shutdown()
+        server.server_close()
+        manager.shutdown()
@@ -0,0 +1,109 @@
+import time
+import threading
+from src.singleflight import SingleFlight, coalesce, coalesced_counts, get_group, request_key
+
+def run_concurrently(fn, n):
+    results, errors = [None] * n, [None] * n
+
+    def target(i):
+        try:
+            results[i] = fn()
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    return threads, results, errors
+
+def wait_for_followers(group, n, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while group.coalesced < n and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+def test_concurrent_identical_calls_share_one_upstream_call():
+    group = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def upstream():
+        calls.append(1)
+        release.wait(timeout=5)
+        return ["12345"]
+
+    threads, results, errors = run_concurrently(lambda: group.do("key", upstream), 4)
+    wait_for_followers(group, 3)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert results == [["12345"]] * 4
+    assert errors == [None] * 4
+    # followers get their own copy
+    assert len({id(r) for r in results}) == 4
+
+def test_leader_error_propagates_to_followers():
+    group = SingleFlight()
+    release = threading.Event()
+
+    def upstream():
+        release.wait(timeout=5)
+        raise RuntimeError("429 Too Many Requests")
+
+    threads, results, errors = run_concurrently(lambda: group.do("key", upstream), 3)
+    wait_for_followers(group, 2)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert all(isinstance(e, RuntimeError) for e in errors)
+    # nothing is cached once the call has finished
+    assert group.do("key", lambda: "fresh") == "fresh"
+
+def test_request_key_normalizes_arguments():
+    def search(query, retmax=10):
+        pass
+
+    key = request_key(search, ("a  query ",), {}, normalize=("query",))
+    assert key == request_key(search, (), {"query": "a query", "retmax": 10}, normalize=("query",))
+    assert request_key(search, ("a query",), {}) != request_key(search, ("a query", 5), {})
+    # whitespace only counts as insignificant where asked
+    assert request_key(search, ("a  query ",), {}) != request_key(search, ("a query",), {})
+    assert len(key) == 32
+
+def test_decorated_calls_coalesce_only_on_normalized_arguments():
+    release = threading.Event()
+    calls = []
+
+    @coalesce("test_normalized", normalize=("query",))
+    def search(query, texts=()):
+        calls.append((query, texts))
+        release.wait(timeout=5)
+        return [query]
+
+    group = get_group("test_normalized")
+    queries = iter(["statins  CKD", " statins CKD", "statins CKD ", "statins\tCKD"])
+    threads, results, errors = run_concurrently(lambda: search(next(queries)), 4)
+    wait_for_followers(group, 3)
+    # differently spaced texts are separate requests
+    texts_thread = threading.Thread(target=search, args=("statins CKD", ("a  b",)))
+    texts_thread.start()
+    while len(calls) < 2:
+        time.sleep(0.001)
+    release.set()
+    for t in threads + [texts_thread]:
+        t.join()
+
+    assert len(calls) == 2
+    assert errors == [None] * 4
+    assert len({tuple(r) for r in results}) == 1
+    assert group.coalesced == 3
+
+def test_coalesce_decorator_counts():
+    @coalesce("test_decorated")
+    def double(x):
+        return x * 2
+
+    assert double(2) == 4
+    assert coalesced_counts()["test_decorated"] == 0